@@ -1,33 +1,397 @@
-from flask import Flask, request, render_template, redirect, jsonify
+from flask import (Flask, Blueprint, request, render_template, redirect, jsonify, Response, stream_template, g,
+                   send_file, has_request_context, current_app)
+from werkzeug.local import LocalProxy
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import re
+import sys
 import smtplib
+import threading
+import time
+import csv
+import io
+import json
+import hashlib
+import tempfile
+import logging
+import difflib
+import functools
+import itertools
+import unicodedata
+import pathlib
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlencode
+import click
 from email.message import EmailMessage
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
 
-from dotenv import load_dotenv
-import os
-import smtplib
-from email.message import EmailMessage
+# Routes and CLI commands live on this blueprint; create_app() builds the app.
+# cli_group=None keeps the commands at the top level (`flask import-identities`).
+bp = Blueprint("identity", __name__, cli_group=None)
+
+# ========================
+# Instrumentation
+# ========================
+# Off by default. With METRICS_ENABLED=1 every request is timed per route,
+# every SQL statement is counted and timed (per request, to spot N+1 query
+# patterns), SMTP sends are timed, and slow queries/requests are logged.
+# Everything is exposed at /metrics in Prometheus text format. When disabled
+# the hooks return at once and connections are plain sqlite3 connections.
+# Thresholds (SLOW_QUERY_MS, SLOW_REQUEST_MS, N_PLUS_ONE_THRESHOLD) are in Config.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+logger = logging.getLogger("identity_system")
+
+class Metric:
+    """Thread-safe counter or histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, labels=(), buckets=None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _label_text(self, label_values, extra=()):
+        pairs = list(zip(self.labels, label_values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        kind = "histogram" if self.buckets else "counter"
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            for label_values, value in items:
+                if not self.buckets:
+                    lines.append(f"{self.name}{self._label_text(label_values)} {value}")
+                    continue
+                counts, total, count = value
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{self._label_text(label_values, [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{self._label_text(label_values, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self._label_text(label_values)} {total}")
+                lines.append(f"{self.name}_count{self._label_text(label_values)} {count}")
+        return "\n".join(lines)
+
+REQUEST_LATENCY = Metric("identity_http_request_duration_seconds", "Request latency by route",
+                         ("method", "endpoint", "status"), LATENCY_BUCKETS)
+REQUEST_QUERIES = Metric("identity_http_request_sql_queries", "SQL statements executed per request",
+                         ("endpoint",), QUERY_COUNT_BUCKETS)
+SQL_LATENCY = Metric("identity_sql_query_duration_seconds", "SQL statement latency by statement type",
+                     ("operation",), LATENCY_BUCKETS)
+SLOW_QUERIES = Metric("identity_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("operation",))
+N_PLUS_ONE = Metric("identity_n_plus_one_total", "Requests repeating one statement N_PLUS_ONE_THRESHOLD+ times",
+                    ("endpoint",))
+SMTP_LATENCY = Metric("identity_smtp_send_duration_seconds", "Time to hand one email to the SMTP server",
+                      ("outcome",), LATENCY_BUCKETS)
+METRICS = [REQUEST_LATENCY, REQUEST_QUERIES, SQL_LATENCY, SLOW_QUERIES, N_PLUS_ONE, SMTP_LATENCY]
+
+def _record_sql(sql, seconds):
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "OTHER"
+    SQL_LATENCY.observe(seconds, operation)
+    if seconds * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        SLOW_QUERIES.inc(operation)
+        logger.warning("Slow query (%.1f ms): %s", seconds * 1000, " ".join(sql.split())[:500])
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements[sql] = g.sql_statements.get(sql, 0) + 1
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(sql, time.perf_counter() - started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors time every statement (sqlite3.connect factory)"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute* would otherwise bypass the cursor overrides
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+@bp.before_app_request
+def start_request_timer():
+    if current_app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        g.sql_statements = {}
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or "unmatched"
+    REQUEST_LATENCY.observe(elapsed, request.method, endpoint, response.status_code)
+    # streamed bodies (view_all, exports) run their queries after this point
+    statements = g.sql_statements
+    REQUEST_QUERIES.observe(sum(statements.values()), endpoint)
+    repeated = [(sql, n) for sql, n in statements.items() if n >= current_app.config['N_PLUS_ONE_THRESHOLD']]
+    if repeated:
+        N_PLUS_ONE.inc(endpoint)
+        sql, n = max(repeated, key=lambda item: item[1])
+        logger.warning("Possible N+1 in %s: statement ran %d times: %s", endpoint, n, " ".join(sql.split())[:200])
+    if elapsed * 1000 >= current_app.config['SLOW_REQUEST_MS']:
+        logger.warning("Slow request (%.1f ms): %s %s", elapsed * 1000, request.method, request.path)
+    return response
+
+@bp.route("/metrics")
+def metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        return Response("Metrics are disabled; set METRICS_ENABLED=1\n", status=404, mimetype="text/plain")
+    body = "\n".join(metric.render() for metric in METRICS)
+    for name, cache in (('identity_cache', identity_cache), ('fragment_cache', fragment_cache)):
+        stats = cache.stats()
+        for key in ('hits', 'misses', 'evictions', 'expirations'):
+            body += (f"\n# TYPE {name}_{key}_total counter\n"
+                     f"{name}_{key}_total {stats[key]}")
+        body += f"\n# TYPE {name}_size gauge\n{name}_size {stats['size']}"
+        if stats['maxbytes'] is not None:
+            body += f"\n# TYPE {name}_bytes gauge\n{name}_bytes {stats['bytes']}"
+    body += "\n"
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+# ========================
+# Database Connection
+# ========================
+# Every connection is tuned the same way. WAL lets readers proceed while a
+# writer holds the lock; busy_timeout makes writers wait instead of failing.
+DB_BUSY_TIMEOUT_MS = 5000
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_CACHED_STATEMENTS = 256
+
+def _connection_factory():
+    return InstrumentedConnection if current_app.config['METRICS_ENABLED'] else sqlite3.Connection
+
+def get_db_connection():
+    """Open a new tuned connection to the current app's DATABASE (CLI commands, streaming, background work)"""
+    conn = sqlite3.connect(current_app.config['DATABASE'], timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           cached_statements=DB_CACHED_STATEMENTS, factory=_connection_factory())
+    conn.row_factory = sqlite3.Row
+    # journal_mode belongs to the database file, and a process may open more than one;
+    # on a file already in WAL mode this is a no-op
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    return conn
+
+def get_db():
+    """Connection shared by everything that runs inside one request (or CLI command)"""
+    if 'db' not in g:
+        g.db = get_db_connection()
+    return g.db
+
+def close_db(exception):
+    for name in ('db', 'read_db'):
+        conn = g.pop(name, None)
+        if conn is not None:
+            conn.close()
 
 # ========================
-# Load environment variables
+# Read Snapshot
 # ========================
-load_dotenv()
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
+# Optional. With READ_SNAPSHOT set, reporting reads (view_all, search, stats,
+# exports and the list/search API) go to a copy of the database refreshed
+# every READ_SNAPSHOT_INTERVAL seconds with the online backup API. Long scans
+# then never hold a read transaction on the primary or hold back its WAL
+# checkpoints. Writes, /view and anything that must show a change right after
+# it was made stay on the primary. A snapshot older than READ_SNAPSHOT_MAX_AGE
+# is not used: reads fall back to the primary until it is refreshed.
+
+def snapshot_age():
+    """Seconds since the snapshot was taken, or None if there is none"""
+    snapshot = current_app.config['READ_SNAPSHOT']
+    if not snapshot:
+        return None
+    try:
+        return max(time.time() - os.stat(snapshot).st_mtime, 0.0)
+    except OSError:
+        return None
+
+def refresh_snapshot():
+    """Copy the primary into READ_SNAPSHOT; returns how long the copy took"""
+    started = time.time()
+    snapshot = current_app.config['READ_SNAPSHOT']
+    partial = f"{snapshot}.{os.getpid()}.tmp"
+    source = get_db_connection()
+    target = sqlite3.connect(partial)
+    try:
+        source.backup(target)
+        # a standalone rollback-journal file that readers can open immutable
+        target.execute("PRAGMA journal_mode = DELETE")
+    except Exception:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.utime(partial, (started, started))  # the snapshot's age counts from the start of the copy
+    os.replace(partial, snapshot)  # connections still open on the old file keep reading it
+    return time.time() - started
+
+def get_snapshot_connection():
+    """Read-only connection to the snapshot, or None if there is none or it is too old"""
+    age = snapshot_age()
+    if age is None or age > current_app.config['READ_SNAPSHOT_MAX_AGE']:
+        return None
+    # the file is only ever replaced, never written in place, so SQLite may skip locking entirely
+    snapshot = pathlib.Path(current_app.config['READ_SNAPSHOT']).resolve()
+    conn = sqlite3.connect(f"{snapshot.as_uri()}?mode=ro&immutable=1", uri=True,
+                           cached_statements=DB_CACHED_STATEMENTS, factory=_connection_factory())
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    if has_request_context():
+        g.snapshot_age = age
+    return conn
+
+def get_read_connection():
+    """New connection for reporting reads: the snapshot when fresh enough, else the primary"""
+    return get_snapshot_connection() or get_db_connection()
+
+def get_read_db():
+    """Per-request connection for reporting reads: the snapshot when fresh enough, else get_db()"""
+    if 'read_db' not in g:
+        g.read_db = get_snapshot_connection()
+    return g.read_db or get_db()
+
+@bp.after_app_request
+def add_snapshot_age_header(response):
+    # tells clients how stale a reporting response may be
+    if g.get('snapshot_age') is not None:
+        response.headers['X-Snapshot-Age'] = f"{g.snapshot_age:.1f}"
+    return response
+
+class SnapshotRefresher:
+    """Refreshes the snapshot from a daemon thread whenever it is READ_SNAPSHOT_INTERVAL old.
+
+    Every worker process runs one; they all look at the snapshot file's age,
+    so the copy is normally made once per interval, not once per worker.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval   # None: the app's READ_SNAPSHOT_INTERVAL
+        self.last_duration = None
+        self._app = None
+        self._interval = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, app):
+        interval = app.config['READ_SNAPSHOT_INTERVAL'] if self.interval is None else self.interval
+        if (not app.config['READ_SNAPSHOT'] or interval <= 0
+                or (self._thread is not None and self._thread.is_alive())):
+            return
+        self._app = app
+        self._interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        with self._app.app_context():
+            self._refresh_loop()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            age = snapshot_age()
+            if age is None or age >= self._interval:
+                try:
+                    self.last_duration = refresh_snapshot()
+                    age = 0.0
+                except Exception:
+                    logger.exception("Snapshot refresh failed")
+                    age = 0.0  # retry after a full interval
+            self._stop.wait(max(self._interval - age, 1))
+
+snapshot_refresher = SnapshotRefresher()
+
+@bp.route("/snapshot_status")
+def snapshot_status():
+    age = snapshot_age()
+    max_age = current_app.config['READ_SNAPSHOT_MAX_AGE']
+    return jsonify({'enabled': bool(current_app.config['READ_SNAPSHOT']),
+                    'age_seconds': None if age is None else round(age, 1),
+                    'interval_seconds': current_app.config['READ_SNAPSHOT_INTERVAL'], 'max_age_seconds': max_age,
+                    'serving_reads': age is not None and age <= max_age,
+                    'last_refresh_seconds': snapshot_refresher.last_duration})
+
+@bp.cli.command("refresh-snapshot")
+def refresh_snapshot_command():
+    """Copy the database into the read snapshot now (for cron instead of the refresher thread)."""
+    snapshot = current_app.config['READ_SNAPSHOT']
+    if not snapshot:
+        raise click.UsageError("Set READ_SNAPSHOT to the snapshot file path first")
+    print(f"Snapshot written to {snapshot} in {refresh_snapshot():.2f}s")
 
 # ========================
 # Send confirmation email
 # ========================
-def send_confirmation(address, uid):
-    msg = EmailMessage()
-    msg['Subject'] = 'Identity Created'
-    msg['From'] = EMAIL_USER
-    msg['To'] = address
-    msg.set_content(f"""Hello,
+# Emails are written to the Outbox table in the same transaction as the
+# change that triggers them; a background worker delivers them over one
+# reused SMTP connection, so requests never wait on the mail server. Only the
+# entry points start that worker (start_background_workers); requests just
+# wake it.
+# Point SMTP_HOST/SMTP_PORT (see Config) at a local stand-in (e.g. `python -m
+# aiosmtpd -n`) with SMTP_SSL=0 for testing; login is skipped when no password is set.
+SMTP_IDLE_TIMEOUT = 60          # close the connection after this many idle seconds
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_LEASE_SECONDS = 300      # a claimed message is retried if its worker dies
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE = 30        # seconds; doubles on every failed attempt, capped at an hour
+
+def queue_confirmation(cur, address, uid):
+    """Add the identity-created email to the outbox (caller commits)"""
+    queue_confirmations(cur, [(address, uid)])
+
+def queue_confirmations(cur, recipients):
+    """Queue one identity-created email per (address, uid) pair (caller commits)"""
+    now = datetime.now().isoformat()
+    cur.executemany("INSERT INTO Outbox (recipient, subject, body, created_at, next_attempt_at) VALUES (?,?,?,?,?)",
+                    [(address, 'Identity Created', f"""Hello,
 
 Your university identity has been successfully created.
 
@@ -36,29 +400,164 @@ Your ID: {uid}
 If you did not request this identity, please contact administration.
 
 University Identity Management System
-""")
-    try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.send_message(msg)
-        print(f"Email sent to {address}")
-    except Exception as e:
-        print(f"Email sending failed to {address}: {e}")
+""", now, now) for address, uid in recipients])
 
-print("Current working directory:", os.getcwd())
-print("Templates folder exists:", os.path.exists("templates"))
+def outbox_backoff(attempts):
+    return timedelta(seconds=min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), 3600))
 
-app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.debug = True
+class OutboxWorker:
+    """Delivers queued emails from a daemon thread over one persistent SMTP connection"""
 
-# ========================
-# Database Connection
-# ========================
-def get_db_connection():
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    def __init__(self):
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._smtp = None
+        self._smtp_used_at = 0.0
+
+    def start(self, app):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Make a running worker look at the outbox now; never starts one.
+
+        Without a worker (CLI commands, tests, benchmarks) queued mail waits
+        for `flask send-outbox` or the next process that runs one.
+        """
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._close_smtp()
+
+    def _run(self):
+        with self._app.app_context():
+            self._deliver_loop()
+
+    def _deliver_loop(self):
+        while not self._stop.is_set():
+            try:
+                while self.drain_once():
+                    pass
+            except Exception:
+                logger.exception("Outbox delivery failed")
+            if self._smtp is not None and time.monotonic() - self._smtp_used_at > SMTP_IDLE_TIMEOUT:
+                self._close_smtp()
+            self._wake.wait(OUTBOX_POLL_SECONDS)
+            self._wake.clear()
+
+    def drain_once(self):
+        """Claim and send one batch of due messages; returns how many were claimed"""
+        conn = get_db_connection()
+        try:
+            batch = self._claim(conn)
+            if not batch:
+                return 0
+            sent, failed = [], []
+            for message in batch:
+                started = time.perf_counter()
+                error = self._send(message)
+                if current_app.config['METRICS_ENABLED']:
+                    SMTP_LATENCY.observe(time.perf_counter() - started, "sent" if error is None else "failed")
+                if error is None:
+                    sent.append(message)
+                else:
+                    failed.append((message, error))
+                    logger.warning("Email to %s failed: %s", message['recipient'], error)
+            now = datetime.now()
+            conn.executemany("UPDATE Outbox SET sent_at=?, attempts=attempts+1, last_error=NULL WHERE id=?",
+                             [(now.isoformat(), m['id']) for m in sent])
+            # after the last attempt next_attempt_at is cleared and the message stays undelivered
+            conn.executemany("UPDATE Outbox SET attempts=?, next_attempt_at=?, last_error=? WHERE id=?",
+                             [(m['attempts'] + 1,
+                               (now + outbox_backoff(m['attempts'] + 1)).isoformat()
+                               if m['attempts'] + 1 < OUTBOX_MAX_ATTEMPTS else None,
+                               str(e), m['id'])
+                              for m, e in failed])
+            conn.commit()
+            for m in sent:
+                logger.info("Email sent to %s", m['recipient'])
+            return len(batch)
+        finally:
+            conn.close()
+
+    def _claim(self, conn):
+        now = datetime.now()
+        conn.execute("BEGIN IMMEDIATE")
+        batch = conn.execute("""SELECT id, recipient, subject, body, attempts FROM Outbox
+                                WHERE sent_at IS NULL AND next_attempt_at <= ?
+                                ORDER BY next_attempt_at LIMIT ?""",
+                             (now.isoformat(), OUTBOX_BATCH_SIZE)).fetchall()
+        lease = (now + timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat()
+        conn.executemany("UPDATE Outbox SET next_attempt_at=? WHERE id=?", [(lease, m['id']) for m in batch])
+        conn.commit()
+        return batch
+
+    def _connect(self):
+        config = current_app.config
+        smtp_class = smtplib.SMTP_SSL if config['SMTP_SSL'] else smtplib.SMTP
+        server = smtp_class(config['SMTP_HOST'], config['SMTP_PORT'], timeout=30)
+        if config['EMAIL_PASS']:
+            server.login(config['EMAIL_USER'], config['EMAIL_PASS'])
+        return server
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _send(self, message):
+        """Send one message, reconnecting once if the kept-alive connection dropped"""
+        msg = EmailMessage()
+        msg['Subject'] = message['subject']
+        msg['From'] = current_app.config['EMAIL_USER']
+        msg['To'] = message['recipient']
+        msg.set_content(message['body'])
+        error = None
+        for _ in range(2):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.send_message(msg)
+                self._smtp_used_at = time.monotonic()
+                return None
+            except smtplib.SMTPServerDisconnected as e:
+                error = e
+            except smtplib.SMTPException as e:
+                # the server refused this message; the connection is still usable
+                return e
+            except OSError as e:
+                error = e
+            self._smtp = None
+        return error
+
+outbox_worker = OutboxWorker()
+
+@bp.cli.command("send-outbox")
+def send_outbox_command():
+    """Deliver every due email in the outbox, then exit."""
+    total = 0
+    while True:
+        claimed = outbox_worker.drain_once()
+        if not claimed:
+            break
+        total += claimed
+    outbox_worker.stop()
+    print(f"Processed {total} queued emails")
 
 # ========================
 # Status Lifecycle Rules
@@ -70,6 +569,9 @@ VALID_TRANSITIONS = {
     'Inactive': ['Archived'],  # Inactive → Archived ONLY (after 5 years, then final)
     'Archived': []  # Archived cannot transition anywhere (final state)
 }
+# (from, to) -> days an identity must have spent in `from` first; the lifecycle
+# engine (LIFECYCLE_RULES) makes each of these transitions automatically when due
+MIN_DAYS_IN_STATUS = {('Inactive', 'Archived'): 365 * 5}
 
 def is_valid_transition(current_status, new_status, status_changed_at=None):
     """Check if transition from current_status to new_status is allowed"""
@@ -81,12 +583,13 @@ def is_valid_transition(current_status, new_status, status_changed_at=None):
         return False  # Not in allowed transitions
     
     # Special rule: Inactive → Archived only after 5 years
-    if current_status == 'Inactive' and new_status == 'Archived':
+    min_days = MIN_DAYS_IN_STATUS.get((current_status, new_status))
+    if min_days:
         if status_changed_at:
             try:
                 changed_date = datetime.fromisoformat(status_changed_at)
                 age_days = (datetime.now() - changed_date).days
-                if age_days < 365 * 5:  # Less than 5 years
+                if age_days < min_days:
                     return False
             except:
                 pass
@@ -95,82 +598,127 @@ def is_valid_transition(current_status, new_status, status_changed_at=None):
 # ========================
 # Initialize Database
 # ========================
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # base table
-    cur.execute('''CREATE TABLE IF NOT EXISTS People (
-                    id TEXT PRIMARY KEY,
-                    type TEXT,
-                    sub_category TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    dob TEXT,
-                    place_of_birth TEXT,
-                    nationality TEXT,
-                    gender TEXT,
-                    email TEXT UNIQUE,
-                    phone TEXT,
-                    status TEXT,
-                    status_changed_at TEXT
-                )''')
-    
-    # Common Data columns (already in base table)
-    # No need to add them again
-    
-    # Student-specific columns
-    student_cols = [
-        'student_high_school_diploma_type TEXT',
-        'student_high_school_diploma_year INTEGER',
-        'student_high_school_honors TEXT',
-        'student_major TEXT',
-        'student_entry_year INTEGER',
-        'student_status TEXT',
-        'student_faculty_department TEXT',
-        'student_group TEXT',
-        'student_scholarship_status TEXT'
-    ]
-    
-    # Faculty-specific columns
-    faculty_cols = [
-        'faculty_rank TEXT',
-        'faculty_employment_category TEXT',
-        'faculty_appointment_start_date TEXT',
-        'faculty_primary_department TEXT',
-        'faculty_secondary_departments TEXT',
-        'faculty_office_building TEXT',
-        'faculty_office_floor TEXT',
-        'faculty_office_room TEXT',
-        'faculty_phd_institution TEXT',
-        'faculty_research_areas TEXT',
-        'faculty_habilitation_supervise TEXT',
-        'faculty_contract_type TEXT',
-        'faculty_contract_start_date TEXT',
-        'faculty_contract_end_date TEXT',
-        'faculty_teaching_hours INTEGER'
-    ]
-    
-    # Staff-specific columns
-    staff_cols = [
-        'staff_assigned_department TEXT',
-        'staff_job_title TEXT',
-        'staff_grade TEXT',
-        'staff_entry_date TEXT'
-    ]
-    
-    # External-specific columns
-    external_cols = [
-        'external_organization TEXT',
-        'external_contact_person TEXT'
-    ]
-    
-    all_extra_cols = student_cols + faculty_cols + staff_cols + external_cols
-    
-    for col in all_extra_cols:
-        try:
+# Schema changes are numbered migrations applied once, in order; the last
+# applied number is stored in PRAGMA user_version.
+
+# Common Data columns (base table)
+PEOPLE_BASE_COLS = [
+    'id TEXT PRIMARY KEY',
+    'type TEXT',
+    'sub_category TEXT',
+    'first_name TEXT',
+    'last_name TEXT',
+    'dob TEXT',
+    'place_of_birth TEXT',
+    'nationality TEXT',
+    'gender TEXT',
+    'email TEXT UNIQUE',
+    'phone TEXT',
+    'status TEXT',
+    'status_changed_at TEXT'
+]
+
+# Student-specific columns
+STUDENT_COLS = [
+    'student_high_school_diploma_type TEXT',
+    'student_high_school_diploma_year INTEGER',
+    'student_high_school_honors TEXT',
+    'student_major TEXT',
+    'student_entry_year INTEGER',
+    'student_status TEXT',
+    'student_faculty_department TEXT',
+    'student_group TEXT',
+    'student_scholarship_status TEXT'
+]
+
+# Faculty-specific columns
+FACULTY_COLS = [
+    'faculty_rank TEXT',
+    'faculty_employment_category TEXT',
+    'faculty_appointment_start_date TEXT',
+    'faculty_primary_department TEXT',
+    'faculty_secondary_departments TEXT',
+    'faculty_office_building TEXT',
+    'faculty_office_floor TEXT',
+    'faculty_office_room TEXT',
+    'faculty_phd_institution TEXT',
+    'faculty_research_areas TEXT',
+    'faculty_habilitation_supervise TEXT',
+    'faculty_contract_type TEXT',
+    'faculty_contract_start_date TEXT',
+    'faculty_contract_end_date TEXT',
+    'faculty_teaching_hours INTEGER'
+]
+
+# Staff-specific columns
+STAFF_COLS = [
+    'staff_assigned_department TEXT',
+    'staff_job_title TEXT',
+    'staff_grade TEXT',
+    'staff_entry_date TEXT'
+]
+
+# External-specific columns
+EXTERNAL_COLS = [
+    'external_organization TEXT',
+    'external_contact_person TEXT'
+]
+
+# every identity field, in the order the create form and importer supply them
+PEOPLE_COLUMNS = [col.split()[0] for col in
+                  PEOPLE_BASE_COLS + STUDENT_COLS + FACULTY_COLS + STAFF_COLS + EXTERNAL_COLS]
+
+# People holds only the common data; each identity type keeps its own fields
+# in a profile table keyed by person_id. PeopleFull joins them back into the
+# wide shape the pages and exports use; SQLite drops the joins a query does
+# not read from.
+CORE_COLUMNS = [col.split()[0] for col in PEOPLE_BASE_COLS] + ['row_version']
+PROFILE_TABLES = {
+    'Student': ('student_profile', [col.split()[0] for col in STUDENT_COLS]),
+    'Faculty': ('faculty_profile', [col.split()[0] for col in FACULTY_COLS]),
+    'Staff': ('staff_profile', [col.split()[0] for col in STAFF_COLS]),
+    'External': ('external_profile', [col.split()[0] for col in EXTERNAL_COLS]),
+}
+COLUMN_TABLE = {col: 'People' for col in CORE_COLUMNS}
+COLUMN_TABLE.update({col: table for table, cols in PROFILE_TABLES.values() for col in cols})
+PROFILE_JOINS = " ".join(f"LEFT JOIN {table} ON {table}.person_id = People.id"
+                         for table, _ in PROFILE_TABLES.values())
+PEOPLE_FULL_SELECT = "People.*, " + ", ".join(f"{table}.{col}" for table, cols in PROFILE_TABLES.values()
+                                               for col in cols)
+CORE_INSERT_SQL = (f"INSERT INTO People ({','.join(CORE_COLUMNS[:-1])}) "
+                   f"VALUES ({','.join('?' * (len(CORE_COLUMNS) - 1))})")
+
+def profile_group(record):
+    """Identity type whose profile table holds this record's extra fields"""
+    group = GROUP_OF_SUB_CATEGORY.get(record.get('sub_category'))
+    if group is None and record.get('type') in PROFILE_TABLES:
+        group = record.get('type')
+    return group
+
+def insert_identities(cur, records):
+    """Insert identities (dicts keyed by PEOPLE_COLUMNS) into People and their profile tables"""
+    cur.executemany(CORE_INSERT_SQL, [tuple(r.get(c) for c in CORE_COLUMNS[:-1]) for r in records])
+    by_group = {}
+    for record in records:
+        group = profile_group(record)
+        if group:
+            by_group.setdefault(group, []).append(record)
+    for group, group_records in by_group.items():
+        table, columns = PROFILE_TABLES[group]
+        cur.executemany(f"INSERT INTO {table} (person_id, {', '.join(columns)}) "
+                        f"VALUES ({', '.join('?' * (len(columns) + 1))})",
+                        [(r['id'], *(r.get(c) for c in columns)) for r in group_records])
+    add_dedup_keys(cur, records)
+
+def _migrate_base_schema(cur):
+    """People and Audit tables; also upgrades databases built by the old ALTER loop"""
+    all_cols = PEOPLE_BASE_COLS + STUDENT_COLS + FACULTY_COLS + STAFF_COLS + EXTERNAL_COLS
+    cur.execute(f"CREATE TABLE IF NOT EXISTS People ({', '.join(all_cols)})")
+    cur.execute("PRAGMA table_info(People)")
+    existing = {row[1] for row in cur.fetchall()}
+    for col in all_cols:
+        if col.split()[0] not in existing:
             cur.execute(f"ALTER TABLE People ADD COLUMN {col}")
-        except Exception:
-            pass  # column already exists
 
     # audit table for tracking changes
     cur.execute('''CREATE TABLE IF NOT EXISTS Audit (
@@ -181,14 +729,302 @@ def init_db():
                     old_value TEXT,
                     new_value TEXT
                 )''')
-    
-    # Add sub_category column if not exists
-    try:
-        cur.execute("ALTER TABLE People ADD COLUMN sub_category TEXT")
-    except Exception:
-        pass
-    
+
+def _migrate_search_index(cur):
+    """People_fts over the original wide People table (superseded by migration 8)"""
+    department = "coalesce({t}.student_faculty_department, {t}.faculty_primary_department, {t}.staff_assigned_department)"
+    def values(t):
+        return (f"{t}.rowid, {t}.first_name, {t}.last_name, {t}.email, "
+                f"{department.format(t=t)}, {t}.student_major, {t}.external_organization")
+    cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS People_fts USING fts5(
+                    first_name, last_name, email, department, major, organization,
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_fts_insert AFTER INSERT ON People BEGIN
+                    INSERT INTO People_fts (rowid, first_name, last_name, email, department, major, organization)
+                    VALUES ({values('NEW')});
+                END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS People_fts_delete AFTER DELETE ON People BEGIN
+                    DELETE FROM People_fts WHERE rowid = OLD.rowid;
+                END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_fts_update
+                AFTER UPDATE OF first_name, last_name, email, student_faculty_department,
+                                faculty_primary_department, staff_assigned_department,
+                                student_major, external_organization ON People BEGIN
+                    DELETE FROM People_fts WHERE rowid = OLD.rowid;
+                    INSERT INTO People_fts (rowid, first_name, last_name, email, department, major, organization)
+                    VALUES ({values('NEW')});
+                END""")
+    cur.execute("DELETE FROM People_fts")
+    cur.execute(f"""INSERT INTO People_fts (rowid, first_name, last_name, email, department, major, organization)
+                    SELECT {values('People')} FROM People""")
+
+def _migrate_secondary_indexes(cur):
+    """Indexes behind allocate_ids, validate_user_data, search, view and the status rules"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_sub_category ON People(sub_category)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_type ON People(type)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_status ON People(status, status_changed_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_name_dob ON People(lower(first_name), lower(last_name), dob, sub_category)")
+    # the UNIQUE index on email is BINARY and cannot serve "email=? COLLATE NOCASE"
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_email_nocase ON People(email COLLATE NOCASE)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_person ON Audit(person_id, changed_at)")
+
+def _migrate_id_sequences(cur):
+    """One counter per ID prefix, seeded past the highest ID already issued"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS IdSequence (
+                    prefix TEXT PRIMARY KEY,
+                    next_value INTEGER NOT NULL
+                ) WITHOUT ROWID''')
+    for range_info in ID_RANGES.values():
+        prefix = range_info['prefix']
+        # ids are [PREFIX][NUMBER]; the range condition stays on the primary key
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        cur.execute("SELECT MAX(CAST(substr(id, 4) AS INTEGER)) FROM People WHERE id >= ? AND id < ?",
+                    (prefix, upper))
+        highest = cur.fetchone()[0]
+        next_value = max(range_info['start'], (highest or 0) + 1)
+        cur.execute("INSERT OR REPLACE INTO IdSequence (prefix, next_value) VALUES (?, ?)", (prefix, next_value))
+
+def _migrate_outbox(cur):
+    cur.execute('''CREATE TABLE IF NOT EXISTS Outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    created_at TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TEXT,
+                    sent_at TEXT,
+                    last_error TEXT
+                )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON Outbox(next_attempt_at) WHERE sent_at IS NULL")
+
+def _migrate_export_indexes(cur):
+    """Incremental exports filter and sort on these timestamps"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_people_status_changed_at ON People(status_changed_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_changed_at ON Audit(changed_at)")
+
+def _migrate_row_version(cur):
+    """Bumped on every update of a People row; API ETags are derived from it"""
+    cur.execute("ALTER TABLE People ADD COLUMN row_version INTEGER NOT NULL DEFAULT 1")
+
+def _migrate_profile_tables(cur):
+    """Move per-type columns out of People into profile tables and rebuild People narrow.
+
+    Runs as one transaction: in WAL mode readers keep seeing the old layout
+    until it commits. rowids are preserved so People_fts stays aligned.
+    """
+    definitions = {'Student': STUDENT_COLS, 'Faculty': FACULTY_COLS, 'Staff': STAFF_COLS, 'External': EXTERNAL_COLS}
+    for group, (table, columns) in PROFILE_TABLES.items():
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+                        person_id TEXT PRIMARY KEY,
+                        {', '.join(definitions[group])}
+                    ) WITHOUT ROWID""")
+        # rows of this type, plus any other row that actually holds data in these columns
+        subs = SUB_CATEGORY_GROUPS[group]
+        non_blank = ", ".join(f"nullif({col}, '')" for col in columns)
+        has_data = f"coalesce({non_blank}, NULL) IS NOT NULL"
+        cur.execute(f"""INSERT INTO {table} (person_id, {', '.join(columns)})
+                        SELECT id, {', '.join(columns)} FROM People
+                        WHERE sub_category IN ({', '.join('?' * len(subs))}) OR {has_data}""", subs)
+
+    for trigger in ('People_fts_insert', 'People_fts_delete', 'People_fts_update'):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    core = ', '.join(CORE_COLUMNS)
+    cur.execute(f"CREATE TABLE People_core ({', '.join(PEOPLE_BASE_COLS)}, row_version INTEGER NOT NULL DEFAULT 1)")
+    cur.execute(f"INSERT INTO People_core (rowid, {core}) SELECT rowid, {core} FROM People")
+    cur.execute("DROP TABLE People")
+    cur.execute("ALTER TABLE People_core RENAME TO People")
+    _migrate_secondary_indexes(cur)
+    _migrate_export_indexes(cur)
+
+    cur.execute(f"CREATE VIEW IF NOT EXISTS PeopleFull AS SELECT {PEOPLE_FULL_SELECT} FROM People {PROFILE_JOINS}")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_profiles_delete AFTER DELETE ON People BEGIN
+                    {' '.join(f'DELETE FROM {table} WHERE person_id = OLD.id;' for table, _ in PROFILE_TABLES.values())}
+                END""")
+    create_search_index(cur)
+    rebuild_search_index(cur)
+
+def _migrate_audit_archive(cur):
+    """Archive table for rolled-over audit rows; both audit tables reject updates"""
+    cur.execute('''CREATE TABLE IF NOT EXISTS AuditArchive (
+                    id INTEGER PRIMARY KEY,
+                    person_id TEXT,
+                    changed_at TEXT,
+                    field TEXT,
+                    old_value TEXT,
+                    new_value TEXT
+                )''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_archive_person ON AuditArchive(person_id, changed_at)")
+    for table in ('Audit', 'AuditArchive'):
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_append_only BEFORE UPDATE ON {table} BEGIN
+                        SELECT RAISE(ABORT, 'audit rows are append-only');
+                    END""")
+
+def _migrate_identity_counts(cur):
+    """Per (type, sub_category, status) counters kept in step with People by triggers"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS IdentityCounts (
+                    type TEXT NOT NULL,
+                    sub_category TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (type, sub_category, status)
+                ) WITHOUT ROWID""")
+    key = "coalesce({t}.type, ''), coalesce({t}.sub_category, ''), coalesce({t}.status, '')"
+    bump = ("INSERT INTO IdentityCounts (type, sub_category, status, count) VALUES ({key}, {delta}) "
+            "ON CONFLICT (type, sub_category, status) DO UPDATE SET count = count + {delta};")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_counts_insert AFTER INSERT ON People BEGIN
+                    {bump.format(key=key.format(t='NEW'), delta=1)}
+                END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_counts_delete AFTER DELETE ON People BEGIN
+                    {bump.format(key=key.format(t='OLD'), delta=-1)}
+                END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS People_counts_update
+                AFTER UPDATE OF type, sub_category, status ON People BEGIN
+                    {bump.format(key=key.format(t='OLD'), delta=-1)}
+                    {bump.format(key=key.format(t='NEW'), delta=1)}
+                END""")
+    cur.execute("DELETE FROM IdentityCounts")
+    cur.execute(f"""INSERT INTO IdentityCounts (type, sub_category, status, count)
+                    SELECT {key.format(t='People')}, COUNT(*) FROM People GROUP BY 1, 2, 3""")
+
+def _migrate_dedup_keys(cur):
+    """Blocking index for fuzzy duplicate detection, seeded from the existing identities"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS DedupKeys (
+                    block_key TEXT NOT NULL,
+                    person_id TEXT NOT NULL,
+                    PRIMARY KEY (block_key, person_id)
+                ) WITHOUT ROWID""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_dedup_keys_person ON DedupKeys(person_id)")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS People_dedup_delete AFTER DELETE ON People BEGIN
+                    DELETE FROM DedupKeys WHERE person_id = OLD.id;
+                END""")
+    cur.execute("DELETE FROM DedupKeys")
+    cur.execute("SELECT id, first_name, last_name, dob FROM People")
+    add_dedup_keys(cur, cur.fetchall())
+
+def _migrate_search_filter_indexes(cur):
+    """Indexes behind the year filter of /search, one per column it checks"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_entry_year ON student_profile(student_entry_year)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_student_diploma_year ON student_profile(student_high_school_diploma_year)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_faculty_appointment_year "
+                "ON faculty_profile(substr(faculty_appointment_start_date, 1, 4))")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_staff_entry_year ON staff_profile(substr(staff_entry_date, 1, 4))")
+
+def _migrate_audit_archive_export_index(cur):
+    """Incremental audit exports read AuditArchive too, so it needs the same watermark index as Audit"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_archive_changed_at ON AuditArchive(changed_at)")
+
+MIGRATIONS = [
+    (1, "base schema", _migrate_base_schema),
+    (2, "full-text search index", _migrate_search_index),
+    (3, "secondary indexes", _migrate_secondary_indexes),
+    (4, "ID sequence counters", _migrate_id_sequences),
+    (5, "email outbox", _migrate_outbox),
+    (6, "export watermark indexes", _migrate_export_indexes),
+    (7, "row versions", _migrate_row_version),
+    (8, "per-type profile tables", _migrate_profile_tables),
+    (9, "audit archive", _migrate_audit_archive),
+    (10, "identity counters", _migrate_identity_counts),
+    (11, "duplicate detection keys", _migrate_dedup_keys),
+    (12, "search filter indexes", _migrate_search_filter_indexes),
+    (13, "audit archive export index", _migrate_audit_archive_export_index),
+]
+
+def init_db():
+    """Apply every migration newer than the database's user_version"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("PRAGMA user_version")
+    if cur.fetchone()[0] >= MIGRATIONS[-1][0]:
+        conn.close()
+        return
+    for number, description, migrate in MIGRATIONS:
+        try:
+            # several workers may start at once: re-check the version under the write lock
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("PRAGMA user_version")
+            if cur.fetchone()[0] >= number:
+                conn.rollback()
+                continue
+            migrate(cur)
+            cur.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        print(f"Applied migration {number}: {description}")
+    conn.close()
+
+# ========================
+# Full-Text Search Index
+# ========================
+# People_fts mirrors the searchable columns of People and the profile tables
+# (keyed by People.rowid) and is kept in sync by triggers, so /search never
+# scans People.
+# profile table -> {People_fts column: profile column}
+PROFILE_FTS_COLUMNS = {
+    'student_profile': {'department': 'student_faculty_department', 'major': 'student_major'},
+    'faculty_profile': {'department': 'faculty_primary_department'},
+    'staff_profile': {'department': 'staff_assigned_department'},
+    'external_profile': {'organization': 'external_organization'},
+}
+
+def create_search_index(cur):
+    """Create the FTS5 table and its sync triggers if missing"""
+    cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS People_fts USING fts5(
+                    first_name, last_name, email, department, major, organization,
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS People_fts_insert AFTER INSERT ON People BEGIN
+                    INSERT INTO People_fts (rowid, first_name, last_name, email)
+                    VALUES (NEW.rowid, NEW.first_name, NEW.last_name, NEW.email);
+                END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS People_fts_delete AFTER DELETE ON People BEGIN
+                    DELETE FROM People_fts WHERE rowid = OLD.rowid;
+                END""")
+    # only re-index when a searchable column changes (status edits skip it)
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS People_fts_update
+                AFTER UPDATE OF first_name, last_name, email ON People BEGIN
+                    UPDATE People_fts SET first_name = NEW.first_name, last_name = NEW.last_name, email = NEW.email
+                    WHERE rowid = NEW.rowid;
+                END""")
+    for table, mapping in PROFILE_FTS_COLUMNS.items():
+        assignments = ", ".join(f"{fts_col} = NEW.{col}" for fts_col, col in mapping.items())
+        body = (f"UPDATE People_fts SET {assignments} "
+                f"WHERE rowid = (SELECT rowid FROM People WHERE id = NEW.person_id);")
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {body} END")
+        cur.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+                    AFTER UPDATE OF {', '.join(mapping.values())} ON {table} BEGIN {body} END""")
+
+def rebuild_search_index(cur):
+    """Repopulate People_fts from People and the profile tables"""
+    cur.execute("DELETE FROM People_fts")
+    cur.execute(f"""INSERT INTO People_fts (rowid, first_name, last_name, email, department, major, organization)
+                    SELECT People.rowid, People.first_name, People.last_name, People.email,
+                           coalesce(student_profile.student_faculty_department,
+                                    faculty_profile.faculty_primary_department,
+                                    staff_profile.staff_assigned_department),
+                           student_profile.student_major, external_profile.external_organization
+                    FROM People {PROFILE_JOINS}""")
+    cur.execute("INSERT INTO People_fts (People_fts) VALUES ('optimize')")
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 prefix query: every word must match the start of a token"""
+    tokens = re.findall(r"\w+", text)
+    return " ".join(f'"{t}"*' for t in tokens)
+
+@bp.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Create (if needed) and repopulate the full-text search index."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    create_search_index(cur)
+    rebuild_search_index(cur)
     conn.commit()
+    cur.execute("SELECT COUNT(*) FROM People_fts")
+    print(f"Search index rebuilt: {cur.fetchone()[0]} identities indexed")
     conn.close()
 
 # ========================
@@ -209,136 +1045,154 @@ ID_RANGES = {
     'Alumni': {'prefix': 'ALM', 'start': 202400001, 'end': 202420000}
 }
 
-def generate_id(sub_category):
-    """Generate ID based on sub-category with specific prefix and range"""
+def allocate_ids(sub_category, count, cur=None):
+    """Reserve up to `count` consecutive IDs of a sub-category's range.
+
+    Advances the IdSequence counter for the range's prefix once for the whole
+    block, so it must run inside the caller's BEGIN IMMEDIATE transaction: the
+    counter and the inserts that use the IDs commit (or roll back) together.
+    Returns fewer IDs than asked for when the range runs out. Uses the
+    request connection unless a cursor is given.
+    """
     if sub_category not in ID_RANGES:
-        # Fallback for unknown categories
-        year = datetime.now().year
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM People WHERE sub_category=?", (sub_category,))
-        number = cur.fetchone()[0] + 1
-        conn.close()
-        return f"TMP{year}{number:05d}"
-    
+        raise ValueError(f"Unknown sub-category: {sub_category}")
+
     range_info = ID_RANGES[sub_category]
     prefix = range_info['prefix']
     start = range_info['start']
     end = range_info['end']
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM People WHERE sub_category=?", (sub_category,))
-    count = cur.fetchone()[0]
-    conn.close()
-    
-    # Get the next sequence number within the range
-    next_num = start + count
-    
+
+    cur = cur or get_db().cursor()
+    # ranges added after the sequence table was seeded start at their beginning
+    cur.execute("INSERT OR IGNORE INTO IdSequence (prefix, next_value) VALUES (?, ?)", (prefix, start))
+    cur.execute("SELECT next_value FROM IdSequence WHERE prefix=?", (prefix,))
+    next_num = cur.fetchone()[0]
+
     # Ensure we stay within the range
-    if next_num > end:
-        # Range exhausted, but we still generate the ID
-        pass
-    
+    last_num = min(next_num + count - 1, end)
+    if last_num < next_num:
+        return []
+    cur.execute("UPDATE IdSequence SET next_value=? WHERE prefix=?", (last_num + 1, prefix))
+
     # Format: [PREFIX][YEAR][NUMBER]
     # Example: STU202400001
-    return f"{prefix}{next_num}"
+    return [f"{prefix}{num}" for num in range(next_num, last_num + 1)]
 
 # ========================
 # Home Page
 # ========================
-@app.route("/")
+@bp.route("/")
 def index():
     return render_template("index.html")
 
 # ========================
 # Validate User Data
 # ========================
-def validate_user_data(data):
-    """Validate user data before creating identity"""
+# Validation is table-driven: which sub-categories belong to which identity
+# type, and which fields each type requires, are declared once here.
+SUB_CATEGORY_GROUPS = {
+    'Student': ['Undergraduate', 'Continuing Education', 'PhD Candidates', 'International/Exchange'],
+    'Faculty': ['Tenured', 'Adjunct/Part-time', 'Visiting Researchers'],
+    'Staff': ['Administrative', 'Technical', 'Temporary'],
+    'External': ['Contractors/Vendors', 'Alumni'],
+}
+GROUP_OF_SUB_CATEGORY = {sub: group for group, subs in SUB_CATEGORY_GROUPS.items() for sub in subs}
+
+REQUIRED_COMMON_FIELDS = ['first_name', 'last_name', 'email', 'dob', 'type', 'sub_category']
+
+# (field, error message) per identity type
+# student_status is defaulted to Pending; user no longer supplies it
+REQUIRED_FIELDS = {
+    'Student': [
+        ('student_major', "Major/Program is required for students"),
+        ('student_entry_year', "Entry year is required for students"),
+        ('student_faculty_department', "Faculty & Department is required for students"),
+    ],
+    'Faculty': [
+        ('faculty_rank', "Rank is required for faculty"),
+        ('faculty_primary_department', "Primary Department is required for faculty"),
+        ('faculty_appointment_start_date', "Appointment Start Date is required for faculty"),
+    ],
+    'Staff': [
+        ('staff_assigned_department', "Assigned Department/Service is required for staff"),
+        ('staff_job_title', "Job Title is required for staff"),
+        ('staff_entry_date', "Date of Entry to University is required for staff"),
+    ],
+    'External': [
+        ('external_organization', "Organization is required for external members"),
+    ],
+}
+
+# fields /edit may change per identity type (besides names and status)
+EDITABLE_FIELDS = {
+    'Student': ['student_high_school_diploma_type', 'student_high_school_diploma_year', 'student_high_school_honors',
+                'student_major', 'student_entry_year', 'student_faculty_department',
+                'student_group', 'student_scholarship_status'],
+    'Faculty': ['faculty_rank', 'faculty_employment_category', 'faculty_appointment_start_date',
+                'faculty_primary_department', 'faculty_secondary_departments',
+                'faculty_office_building', 'faculty_office_floor', 'faculty_office_room',
+                'faculty_phd_institution', 'faculty_research_areas', 'faculty_habilitation_supervise',
+                'faculty_contract_type', 'faculty_contract_start_date', 'faculty_contract_end_date',
+                'faculty_teaching_hours'],
+    'Staff': ['staff_assigned_department', 'staff_job_title', 'staff_grade', 'staff_entry_date'],
+    'External': ['external_organization', 'external_contact_person'],
+}
+
+EMAIL_RE = re.compile(r'^[^\s@]+@[^\s@]+\.[^\s@]+$')
+
+DUPLICATE_IDENTITY_ERROR = "An identity with the same name, date of birth, and sub-category already exists"
+DUPLICATE_EMAIL_ERROR = "Email already exists"
+
+# one round trip for both uniqueness rules of a single record
+UNIQUENESS_SQL = """SELECT
+    EXISTS(SELECT 1 FROM People WHERE lower(first_name)=? AND lower(last_name)=? AND dob=? AND sub_category=?),
+    EXISTS(SELECT 1 FROM People WHERE email=? COLLATE NOCASE)"""
+
+SQL_IN_CHUNK = 500  # stay well under SQLite's bound-parameter limit
+
+def _blank(value):
+    return value is None or str(value).strip() == ''
+
+def identity_key(data):
+    """(first, last, dob, sub_category) as the duplicate rule compares it, or None if incomplete"""
+    if _blank(data.get('first_name')) or _blank(data.get('last_name')) or not data.get('dob') or not data.get('sub_category'):
+        return None
+    return (str(data['first_name']).strip().lower(), str(data['last_name']).strip().lower(),
+            data['dob'], data['sub_category'])
+
+def check_user_fields(data):
+    """Field-level checks that need no database access"""
     errors = []
     
     # Check for empty fields
-    required_fields = ['first_name', 'last_name', 'email', 'dob', 'type', 'sub_category']
-    for field in required_fields:
-        if not data.get(field) or str(data.get(field)).strip() == '':
+    for field in REQUIRED_COMMON_FIELDS:
+        if _blank(data.get(field)):
             errors.append(f"{field.replace('_', ' ')} cannot be empty")
-
-    # duplicate check: same name + dob + same sub_category
-    if data.get('first_name') and data.get('last_name') and data.get('dob') and data.get('sub_category'):
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT COUNT(*) FROM People WHERE lower(first_name)=? AND lower(last_name)=? AND dob=? AND sub_category=?",
-            (data['first_name'].strip().lower(), data['last_name'].strip().lower(), data['dob'], data['sub_category'])
-        )
-        if cur.fetchone()[0] > 0:
-            errors.append("An identity with the same name, date of birth, and sub-category already exists")
-        conn.close()
     
     # Check first name (at least 2 characters)
-    first_name = str(data.get('first_name', '')).strip()
+    first_name = str(data.get('first_name') or '').strip()
     if first_name and len(first_name) < 2:
         errors.append("First name must be at least 2 characters")
     # also check last name exists (same requirement)
-    last_name = str(data.get('last_name', '')).strip()
+    last_name = str(data.get('last_name') or '').strip()
     if last_name and len(last_name) < 2:
         errors.append("Last name must be at least 2 characters")
 
     # sub_category-specific required fields
-    sub_cat = data.get('sub_category', '').strip()
-    
-    # Student sub-categories
-    if sub_cat in ['Undergraduate', 'Continuing Education', 'PhD Candidates', 'International/Exchange']:
-        if not data.get('student_major') or not str(data.get('student_major')).strip():
-            errors.append("Major/Program is required for students")
-        if not data.get('student_entry_year') or not str(data.get('student_entry_year')).strip():
-            errors.append("Entry year is required for students")
-        # student_status is now defaulted to Pending; user no longer supplies it
-        if not data.get('student_faculty_department') or not str(data.get('student_faculty_department')).strip():
-            errors.append("Faculty & Department is required for students")
-    
-    # Faculty sub-categories
-    if sub_cat in ['Tenured', 'Adjunct/Part-time', 'Visiting Researchers']:
-        if not data.get('faculty_rank') or not str(data.get('faculty_rank')).strip():
-            errors.append("Rank is required for faculty")
-        if not data.get('faculty_primary_department') or not str(data.get('faculty_primary_department')).strip():
-            errors.append("Primary Department is required for faculty")
-        if not data.get('faculty_appointment_start_date') or not str(data.get('faculty_appointment_start_date')).strip():
-            errors.append("Appointment Start Date is required for faculty")
-    
-    # Staff sub-categories
-    if sub_cat in ['Administrative', 'Technical', 'Temporary']:
-        if not data.get('staff_assigned_department') or not str(data.get('staff_assigned_department')).strip():
-            errors.append("Assigned Department/Service is required for staff")
-        if not data.get('staff_job_title') or not str(data.get('staff_job_title')).strip():
-            errors.append("Job Title is required for staff")
-        if not data.get('staff_entry_date') or not str(data.get('staff_entry_date')).strip():
-            errors.append("Date of Entry to University is required for staff")
-    
-    # External sub-categories
-    if sub_cat in ['Contractors/Vendors', 'Alumni']:
-        if not data.get('external_organization') or not str(data.get('external_organization')).strip():
-            errors.append("Organization is required for external members")
+    sub_cat = (data.get('sub_category') or '').strip()
+    if sub_cat and sub_cat not in ID_RANGES:
+        errors.append("Unknown sub-category")
+    for field, message in REQUIRED_FIELDS.get(GROUP_OF_SUB_CATEGORY.get(sub_cat), []):
+        if _blank(data.get(field)):
+            errors.append(message)
     
     # Check email validity
-    email = str(data.get('email', '')).strip()
-    email_regex = r'^[^\s@]+@[^\s@]+\.[^\s@]+$'
-    if email and not re.match(email_regex, email):
+    email = str(data.get('email') or '').strip()
+    if email and not EMAIL_RE.match(email):
         errors.append("Invalid email format")
     
-    # Check if email is not duplicate
-    if email:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM People WHERE email=? COLLATE NOCASE", (email.lower(),))
-        count = cur.fetchone()[0]
-        conn.close()
-        if count > 0:
-            errors.append("Email already exists")
-    
     # Check phone number (numbers only)
-    phone = str(data.get('phone', '')).strip()
+    phone = str(data.get('phone') or '').strip()
     if phone and not phone.isdigit():
         errors.append("Phone must contain only numbers")
     
@@ -362,196 +1216,866 @@ def validate_user_data(data):
     
     return errors
 
+def validate_user_data(data):
+    """Validate user data before creating identity"""
+    errors = check_user_fields(data)
+
+    key = identity_key(data)
+    email = str(data.get('email') or '').strip().lower()
+    if key or email:
+        cur = get_db().cursor()
+        cur.execute(UNIQUENESS_SQL, (*(key or (None,) * 4), email or None))
+        duplicate_identity, duplicate_email = cur.fetchone()
+        if duplicate_identity:
+            errors.append(DUPLICATE_IDENTITY_ERROR)
+        if duplicate_email:
+            errors.append(DUPLICATE_EMAIL_ERROR)
+
+    return errors
+
+def _chunks(items, size=SQL_IN_CHUNK):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def find_existing_emails(cur, emails):
+    """Return the subset of (lower-case) emails already registered"""
+    found = set()
+    for chunk in _chunks(set(emails)):
+        cur.execute(f"SELECT lower(email) FROM People WHERE email COLLATE NOCASE IN ({','.join('?' * len(chunk))})",
+                    chunk)
+        found.update(row[0] for row in cur.fetchall())
+    return found
+
+def identity_keys_sql(count):
+    """Existing identity keys among `count` (first, last, dob, sub_category) parameter quadruples"""
+    # one idx_people_name_dob lookup per key; CROSS JOIN keeps the key list on the outside
+    return (f"""SELECT batch.column1, batch.column2, batch.column3, batch.column4
+                FROM (VALUES {','.join(['(?,?,?,?)'] * count)}) AS batch CROSS JOIN People
+                ON lower(People.first_name) = batch.column1 AND lower(People.last_name) = batch.column2
+                   AND People.dob = batch.column3 AND People.sub_category = batch.column4""")
+
+def find_existing_identity_keys(cur, keys):
+    """Return the subset of identity_key() tuples already registered"""
+    found = set()
+    for chunk in _chunks(set(keys), SQL_IN_CHUNK // 4):
+        cur.execute(identity_keys_sql(len(chunk)), [value for key in chunk for value in key])
+        found.update(tuple(row) for row in cur.fetchall())
+    return found
+
+def validate_batch(records, cur=None):
+    """Validate many records at once; returns one error list per record.
+
+    Besides the per-record field checks, records are checked against each
+    other and against the database with one IN query per uniqueness rule.
+    """
+    results = [check_user_fields(data) for data in records]
+    keys = [identity_key(data) for data in records]
+    emails = [str(data.get('email') or '').strip().lower() for data in records]
+
+    seen_keys, seen_emails = set(), set()
+    for errors, key, email in zip(results, keys, emails):
+        if key in seen_keys:
+            errors.append("Identity appears more than once in this batch")
+        if email and email in seen_emails:
+            errors.append("Email appears more than once in this batch")
+        if key:
+            seen_keys.add(key)
+        if email:
+            seen_emails.add(email)
+
+    cur = cur or get_db().cursor()
+    taken_keys = find_existing_identity_keys(cur, [k for k in keys if k])
+    taken_emails = find_existing_emails(cur, [e for e in emails if e])
+    for errors, key, email in zip(results, keys, emails):
+        if key in taken_keys:
+            errors.append(DUPLICATE_IDENTITY_ERROR)
+        if email in taken_emails:
+            errors.append(DUPLICATE_EMAIL_ERROR)
+    return results
+
+# ========================
+# Duplicate Detection
+# ========================
+# The exact rule above misses typos, transliterations and the same person
+# under another sub-category. DedupKeys is a blocking index: every identity
+# is filed under a few coarse keys built from Soundex codes of its names and
+# its date of birth, and only identities that share a key are ever compared.
+# insert_identities() and /edit keep it current; a trigger handles deletes.
+# candidates must score at least DEDUP_MATCH_THRESHOLD (see Config)
+DEDUP_MAX_BLOCK_SIZE = 200  # find-duplicates skips blocks larger than this (very common names)
+
+SOUNDEX_CODES = {letter: digit for digit, letters in [('1', 'bfpv'), ('2', 'cgjkqsxz'), ('3', 'dt'),
+                                                      ('4', 'l'), ('5', 'mn'), ('6', 'r')]
+                 for letter in letters}
+
+@functools.lru_cache(maxsize=65536)
+def normalize_name(value):
+    """Lower-case letters and digits only, with accents folded to ASCII (José-María -> josemaria)"""
+    folded = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode()
+    return ''.join(c for c in folded.lower() if c.isalnum())
+
+def soundex(value):
+    """American Soundex code of a name, or '' if it has no letters"""
+    name = normalize_name(value)
+    if not name:
+        return ''
+    code, previous = name[0].upper(), SOUNDEX_CODES.get(name[0])
+    for letter in name[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+def dedup_keys(record):
+    """Blocking keys of an identity; a typo in the first name, the last name, the birth year or the
+    birth day/month leaves at least one key shared"""
+    first, last, dob = soundex(record['first_name']), soundex(record['last_name']), record['dob']
+    if not first or not last or not dob:
+        return set()
+    # the name-pair keys ignore name order, so swapped first/last names still meet
+    names = '|'.join(sorted((first, last)))
+    return {f"f:{dob}|{first}", f"l:{dob}|{last}", f"y:{dob[:4]}|{names}", f"d:{dob[5:]}|{names}"}
+
+def add_dedup_keys(cur, records):
+    """File identities (mappings with id, first_name, last_name, dob) under their blocking keys"""
+    cur.executemany("INSERT OR IGNORE INTO DedupKeys (block_key, person_id) VALUES (?, ?)",
+                    [(key, r['id']) for r in records for key in dedup_keys(r)])
+
+def _name_similarity(a, b):
+    return difflib.SequenceMatcher(None, normalize_name(a), normalize_name(b)).ratio()
+
+def _dob_similarity(a, b):
+    if a == b:
+        return 1.0
+    if not a or not b or len(a) != len(b):
+        return 0.0
+    if sum(x != y for x, y in zip(a, b)) == 1:
+        return 0.8  # one mistyped digit
+    year, month, day = (a.split('-') + ['', ''])[:3]
+    if f"{year}-{day}-{month}" == b:
+        return 0.8  # day and month swapped
+    return 0.0
+
+def match_score(a, b):
+    """0..1 likelihood that two identities are the same person, from names (either order) and dob"""
+    return _match_score(a, b, _dob_similarity(a['dob'], b['dob']))
+
+def _match_score(a, b, dob_similarity):
+    straight = (_name_similarity(a['first_name'], b['first_name']) +
+                _name_similarity(a['last_name'], b['last_name'])) / 2
+    swapped = (_name_similarity(a['first_name'], b['last_name']) +
+               _name_similarity(a['last_name'], b['first_name'])) / 2
+    return round(0.7 * max(straight, swapped) + 0.3 * dob_similarity, 3)
+
+DEDUP_CANDIDATE_COLUMNS = "People.id, first_name, last_name, dob, type, sub_category, status"
+
+def find_duplicate_candidates(cur, record, threshold=None):
+    """Existing identities that are probably `record`, as (score, row) best first; only its blocks are read"""
+    if threshold is None:
+        threshold = current_app.config['DEDUP_MATCH_THRESHOLD']
+    keys = sorted(dedup_keys(record))
+    if not keys:
+        return []
+    cur.execute(f"""SELECT DISTINCT {DEDUP_CANDIDATE_COLUMNS} FROM DedupKeys
+                    JOIN People ON People.id = DedupKeys.person_id
+                    WHERE block_key IN ({','.join('?' * len(keys))})""", keys)
+    candidates = [(match_score(record, row), row) for row in cur.fetchall() if row['id'] != record.get('id')]
+    return sorted((c for c in candidates if c[0] >= threshold), key=lambda c: c[0], reverse=True)
+
+def find_duplicates(cur, threshold=None, max_block_size=DEDUP_MAX_BLOCK_SIZE):
+    """All likely duplicate pairs as (score, a, b) best first, plus counters for the run.
+
+    One pass over DedupKeys in key order, comparing identities only within a
+    block, so the work grows with the number of identities rather than its square.
+    """
+    if threshold is None:
+        threshold = current_app.config['DEDUP_MATCH_THRESHOLD']
+    cur.execute(f"""SELECT block_key, {DEDUP_CANDIDATE_COLUMNS} FROM DedupKeys
+                    JOIN People ON People.id = DedupKeys.person_id ORDER BY block_key""")
+    stats = {'blocks': 0, 'skipped_blocks': 0, 'comparisons': 0}
+    compared, pairs = set(), []
+    for _, block in itertools.groupby(cur, key=lambda row: row['block_key']):
+        block = list(block)
+        if len(block) < 2:
+            continue
+        if len(block) > max_block_size:
+            stats['skipped_blocks'] += 1
+            continue
+        stats['blocks'] += 1
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                pair = tuple(sorted((a['id'], b['id'])))
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                stats['comparisons'] += 1
+                # names weigh 0.7: skip the string matching when the dobs alone rule the pair out
+                dob_similarity = _dob_similarity(a['dob'], b['dob'])
+                if 0.7 + 0.3 * dob_similarity < threshold:
+                    continue
+                score = _match_score(a, b, dob_similarity)
+                if score >= threshold:
+                    pairs.append((score, a, b))
+    pairs.sort(key=lambda p: (-p[0], p[1]['id']))
+    return pairs, stats
+
+@bp.cli.command("find-duplicates")
+@click.option("--threshold", type=float, help="Minimum match score (0-1; default: DEDUP_MATCH_THRESHOLD).")
+@click.option("--max-block-size", default=DEDUP_MAX_BLOCK_SIZE, show_default=True)
+def find_duplicates_command(threshold, max_block_size):
+    """List identities that are probably the same person."""
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        pairs, stats = find_duplicates(conn.cursor(), threshold, max_block_size)
+    finally:
+        conn.close()
+    describe = lambda p: f"{p['id']} {p['first_name']} {p['last_name']} {p['dob']} ({p['sub_category']}, {p['status']})"
+    for score, a, b in pairs:
+        print(f"{score:.2f}  {describe(a)}  <->  {describe(b)}")
+    print(f"{len(pairs)} likely duplicate pairs; {stats['comparisons']} comparisons in {stats['blocks']} blocks "
+          f"({stats['skipped_blocks']} oversized blocks skipped) in {time.perf_counter() - started:.2f}s")
+
 # ========================
 # Create Identity
 # ========================
-@app.route("/create", methods=["GET","POST"])
+def create_identities(cur, records, send_emails=True):
+    """Validate, number and insert new identities; returns (uid, None) or (None, errors) per record.
+
+    The one create path behind /create, bulk import and the async service. It
+    must run inside the caller's BEGIN IMMEDIATE transaction, so uniqueness is
+    checked under the write lock and the ID counters, rows and confirmation
+    emails commit (or roll back) together. Records are cleaned like import rows
+    and every new identity starts out Pending.
+    """
+    records = [_clean_import_record(record) for record in records]
+    results = [(None, errors) if errors else None for errors in validate_batch(records, cur)]
+    by_sub_category = {}
+    for i, record in enumerate(records):
+        if results[i] is None:
+            by_sub_category.setdefault(record['sub_category'], []).append(i)
+
+    now = datetime.now().isoformat()
+    rows = []
+    for sub_category, indexes in by_sub_category.items():
+        ids = allocate_ids(sub_category, len(indexes), cur)
+        for i, uid in zip(indexes, ids):
+            records[i].update(id=uid, status='Pending', status_changed_at=now,
+                              student_status='Pending' if records[i]['type'] == 'Student' else None)
+            rows.append(records[i])
+            results[i] = (uid, None)
+        for i in indexes[len(ids):]:
+            results[i] = (None, [f"ID range for {sub_category} is exhausted"])
+
+    insert_identities(cur, rows)
+    if send_emails:
+        # delivered by the outbox worker
+        queue_confirmations(cur, [(row['email'], row['id']) for row in rows if row['email']])
+    return results
+
+def create_identity(cur, record, send_email=True):
+    """create_identities() for a single record; returns (uid, None) or (None, errors)"""
+    return create_identities(cur, [record], send_email)[0]
+
+@bp.route("/create", methods=["GET","POST"])
 def create():
     if request.method == "POST":
-        user_type = request.form.get("type")
-        sub_category = request.form.get("sub_category")
-        first_name = request.form.get("first_name")
-        last_name = request.form.get("last_name")
-        dob = request.form.get("dob")
-        place_of_birth = request.form.get("place_of_birth")
-        nationality = request.form.get("nationality")
-        gender = request.form.get("gender")
-        email = request.form.get("email")
-        phone = request.form.get("phone")
-        status = "Pending"
-        
-        # Student fields
-        student_diploma_type = request.form.get("student_high_school_diploma_type")
-        student_diploma_year = request.form.get("student_high_school_diploma_year")
-        student_diploma_honors = request.form.get("student_high_school_honors")
-        student_major = request.form.get("student_major")
-        student_entry_year = request.form.get("student_entry_year")
-        # student_status removed from form; default to Pending for student types
-        student_status = "Pending" if user_type == "Student" else None
-        student_faculty_department = request.form.get("student_faculty_department")
-        student_group = request.form.get("student_group")
-        student_scholarship = request.form.get("student_scholarship_status")
-        
-        # Faculty fields
-        faculty_rank = request.form.get("faculty_rank")
-        faculty_employment = request.form.get("faculty_employment_category")
-        faculty_appt_start = request.form.get("faculty_appointment_start_date")
-        faculty_primary_dept = request.form.get("faculty_primary_department")
-        faculty_secondary_depts = request.form.get("faculty_secondary_departments")
-        faculty_office_building = request.form.get("faculty_office_building")
-        faculty_office_floor = request.form.get("faculty_office_floor")
-        faculty_office_room = request.form.get("faculty_office_room")
-        faculty_phd_inst = request.form.get("faculty_phd_institution")
-        faculty_research = request.form.get("faculty_research_areas")
-        faculty_habilitation = request.form.get("faculty_habilitation_supervise")
-        faculty_contract_type = request.form.get("faculty_contract_type")
-        faculty_contract_start = request.form.get("faculty_contract_start_date")
-        faculty_contract_end = request.form.get("faculty_contract_end_date")
-        faculty_teaching_hours = request.form.get("faculty_teaching_hours")
-        
-        # Staff fields
-        staff_dept = request.form.get("staff_assigned_department")
-        staff_job_title = request.form.get("staff_job_title")
-        staff_grade = request.form.get("staff_grade")
-        staff_entry = request.form.get("staff_entry_date")
-        
-        # External fields
-        external_org = request.form.get("external_organization")
-        external_contact = request.form.get("external_contact_person")
-        
-        # Validate data
-        validation_data = {
-            'type': user_type,
-            'sub_category': sub_category,
-            'first_name': first_name,
-            'last_name': last_name,
-            'dob': dob,
-            'email': email,
-            'phone': phone,
-            'student_major': student_major,
-            'student_entry_year': student_entry_year,
-            # student_status intentionally omitted from validation_data
-            'student_faculty_department': student_faculty_department,
-            'faculty_rank': faculty_rank,
-            'faculty_primary_department': faculty_primary_dept,
-            'faculty_appointment_start_date': faculty_appt_start,
-            'staff_assigned_department': staff_dept,
-            'staff_job_title': staff_job_title,
-            'staff_entry_date': staff_entry,
-            'external_organization': external_org
-        }
-        
-        errors = validate_user_data(validation_data)
+        # form fields are named after the columns; student_status is always Pending
+        record = _clean_import_record(request.form)
+        errors = validate_user_data(record)
         if errors:
             return render_template("create.html", errors=errors)
+        # near matches are a warning: the form is shown again until the user confirms
+        if not request.form.get("confirm_not_duplicate"):
+            candidates = find_duplicate_candidates(get_db().cursor(), record)
+            if candidates:
+                return render_template("create.html", candidates=candidates)
 
-        uid = generate_id(sub_category)
-
+        conn = get_db()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            now = datetime.now().isoformat()
-            cur.execute("""INSERT INTO People (id,type,sub_category,first_name,last_name,dob,place_of_birth,
-                            nationality,gender,email,phone,status,status_changed_at,
-                            student_high_school_diploma_type,student_high_school_diploma_year,student_high_school_honors,
-                            student_major,student_entry_year,student_status,student_faculty_department,student_group,student_scholarship_status,
-                            faculty_rank,faculty_employment_category,faculty_appointment_start_date,
-                            faculty_primary_department,faculty_secondary_departments,
-                            faculty_office_building,faculty_office_floor,faculty_office_room,
-                            faculty_phd_institution,faculty_research_areas,faculty_habilitation_supervise,
-                            faculty_contract_type,faculty_contract_start_date,faculty_contract_end_date,faculty_teaching_hours,
-                            staff_assigned_department,staff_job_title,staff_grade,staff_entry_date,
-                            external_organization,external_contact_person)
-                           VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-                        (uid,user_type,sub_category,first_name.strip(),last_name.strip(),dob,place_of_birth,nationality,gender,email.strip().lower(),phone,status,now,
-                         student_diploma_type,student_diploma_year,student_diploma_honors,
-                         student_major,student_entry_year,student_status,student_faculty_department,student_group,student_scholarship,
-                         faculty_rank,faculty_employment,faculty_appt_start,
-                         faculty_primary_dept,faculty_secondary_depts,
-                         faculty_office_building,faculty_office_floor,faculty_office_room,
-                         faculty_phd_inst,faculty_research,faculty_habilitation,
-                         faculty_contract_type,faculty_contract_start,faculty_contract_end,faculty_teaching_hours,
-                         staff_dept,staff_job_title,staff_grade,staff_entry,
-                         external_org,external_contact))
+            conn.execute("BEGIN IMMEDIATE")
+            uid, errors = create_identity(conn.cursor(), record)
+            if errors:
+                conn.rollback()
+                return render_template("create.html", errors=errors)
             conn.commit()
-            conn.close()
-            # send confirmation email (print if failure)
-            if email:
-                send_confirmation(email.strip().lower(), uid)
-            return render_template("success.html", 
-                                 uid=uid,
-                                 identity_type=user_type,
-                                 sub_category=sub_category,
-                                 first_name=first_name.strip(),
-                                 last_name=last_name.strip(),
-                                 email=email.strip().lower(),
-                                 status=status)
         except Exception as e:
+            conn.rollback()
             return render_template("error.html", error=str(e))
+        if record['email']:
+            outbox_worker.wake()
+        return render_template("success.html",
+                               uid=uid,
+                               identity_type=record['type'],
+                               sub_category=record['sub_category'],
+                               first_name=record['first_name'],
+                               last_name=record['last_name'],
+                               email=record['email'],
+                               status='Pending')
 
     return render_template("create.html")
 
+# ========================
+# Bulk Import
+# ========================
+# Files are parsed row by row and handled in batches: validate_batch (one
+# set-based query per uniqueness rule), one ID block per sub-category and one
+# executemany insert, all in a single transaction per batch.
+IMPORT_BATCH_SIZE = 500
+IMPORT_REPORT_MAX_ERRORS = 500
+# id, status and status timestamps are assigned on import, never read from the file
+IMPORT_COLUMNS = [c for c in PEOPLE_COLUMNS if c not in ('id', 'status', 'status_changed_at', 'student_status')]
+
+def import_format(filename, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+def iter_import_rows(stream, fmt):
+    """Yield (line number, record, parse error) from a CSV or JSONL text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_num, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_num, None, "Expected a JSON object"
+            continue
+        yield line_num, record, None
+
+def _clean_import_record(record):
+    clean = {}
+    for col in IMPORT_COLUMNS:
+        value = record.get(col)
+        if value is not None:
+            value = str(value).strip() or None
+        clean[col] = value
+    if clean['email']:
+        clean['email'] = clean['email'].lower()
+    return clean
+
+def _import_batch(batch, report, send_emails):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        results = create_identities(cur, [record for _, record in batch], send_emails)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for (line_num, _), (uid, errors) in zip(batch, results):
+        if uid:
+            report['imported'] += 1
+            continue
+        report['failed'] += 1
+        if len(report['errors']) < IMPORT_REPORT_MAX_ERRORS:
+            report['errors'].append((line_num, errors))
+
+def import_identities(rows, send_emails=True, batch_size=IMPORT_BATCH_SIZE):
+    """Import parsed rows in batches and return a report with per-row errors and throughput"""
+    report = {'total': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    started = time.perf_counter()
+    batch = []
+    for line_num, record, error in rows:
+        report['total'] += 1
+        if error:
+            report['failed'] += 1
+            if len(report['errors']) < IMPORT_REPORT_MAX_ERRORS:
+                report['errors'].append((line_num, [error]))
+            continue
+        batch.append((line_num, record))
+        if len(batch) >= batch_size:
+            _import_batch(batch, report, send_emails)
+            batch = []
+    if batch:
+        _import_batch(batch, report, send_emails)
+    report['errors'].sort()
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['total'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+@bp.route("/import", methods=["GET","POST"])
+def bulk_import():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            return render_template("import.html", error="Choose a CSV or JSONL file to import")
+        fmt = import_format(upload.filename, request.form.get("format"))
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        try:
+            report = import_identities(iter_import_rows(stream, fmt),
+                                       send_emails=request.form.get("send_emails") == "1")
+        except Exception as e:
+            return render_template("error.html", error=str(e))
+        if report['imported']:
+            outbox_worker.wake()
+        return render_template("import.html", report=report, max_errors=IMPORT_REPORT_MAX_ERRORS)
+
+    return render_template("import.html")
+
+@bp.cli.command("import-identities")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Defaults to the file extension.")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option("--no-email", is_flag=True, help="Do not queue confirmation emails.")
+def import_identities_command(path, fmt, batch_size, no_email):
+    """Bulk-create identities from a CSV or JSONL file."""
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        report = import_identities(iter_import_rows(stream, import_format(path, fmt)),
+                                   send_emails=not no_email, batch_size=batch_size)
+    for line_num, row_errors in report['errors']:
+        print(f"line {line_num}: {'; '.join(row_errors)}")
+    print(f"Imported {report['imported']} of {report['total']} rows ({report['failed']} failed) "
+          f"in {report['seconds']:.2f}s, {report['rows_per_second']:.0f} rows/s")
+    if report['imported'] and not no_email:
+        print("Confirmation emails queued; run 'flask send-outbox' or start the app to deliver them")
+
+# ========================
+# Dashboard Statistics
+# ========================
+# IdentityCounts is maintained by triggers on People inside every writer's
+# transaction, so these reads cost one row per category, not one per identity.
+def identity_stats(cur):
+    """Counts by type, sub-category and status plus ID range utilization"""
+    cur.execute("SELECT type, sub_category, status, count FROM IdentityCounts WHERE count > 0 "
+                "ORDER BY type, sub_category, status")
+    counts = [dict(row) for row in cur.fetchall()]
+    totals = {'total': 0, 'by_type': {}, 'by_status': {}}
+    for row in counts:
+        totals['total'] += row['count']
+        totals['by_type'][row['type']] = totals['by_type'].get(row['type'], 0) + row['count']
+        totals['by_status'][row['status']] = totals['by_status'].get(row['status'], 0) + row['count']
+
+    cur.execute("SELECT prefix, next_value FROM IdSequence")
+    next_values = {row['prefix']: row['next_value'] for row in cur.fetchall()}
+    id_ranges = []
+    for sub_category, range_info in ID_RANGES.items():
+        capacity = range_info['end'] - range_info['start'] + 1
+        # allocated IDs are never reused, so deleted identities still count as used
+        used = next_values.get(range_info['prefix'], range_info['start']) - range_info['start']
+        id_ranges.append({'sub_category': sub_category, 'prefix': range_info['prefix'],
+                          'used': used, 'capacity': capacity, 'remaining': capacity - used,
+                          'utilization': round(used / capacity, 4)})
+    return {**totals, 'counts': counts, 'id_ranges': id_ranges}
+
+@bp.route("/stats")
+def stats():
+    return render_template("stats.html", stats=identity_stats(get_read_db().cursor()))
+
+@bp.route("/api/v1/stats")
+def api_stats():
+    return jsonify(identity_stats(get_read_db().cursor()))
+
 # ========================
 # View All Identities
 # ========================
-@app.route("/view_all")
+# Only the columns the table actually shows, plus row_version for the fragment cache
+VIEW_ALL_COLUMNS = "id, type, first_name, last_name, status, row_version"
+VIEW_ALL_PAGE_SIZE = 100
+# stream_template yields a few short strings per row; the server writes this much at a time instead
+STREAM_BUFFER_SIZE = 16 * 1024
+
+def iter_people_page(conn, after_id, limit):
+    """Yield one keyset page of people ordered by id, straight from the cursor; closes conn when done"""
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {VIEW_ALL_COLUMNS} FROM People WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, limit))
+        for row in cur:
+            yield row
+    finally:
+        conn.close()
+
+def buffered(chunks, size=STREAM_BUFFER_SIZE):
+    """Join a stream of small str chunks into pieces of at least `size` characters"""
+    pending, length = [], 0
+    for chunk in chunks:
+        pending.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(pending)
+            pending, length = [], 0
+    if pending:
+        yield "".join(pending)
+
+@bp.route("/view_all")
 def view_all():
+    # keyset pagination: ?after=<last id of previous page>
+    after_id = request.args.get("after", "")
+    try:
+        limit = int(request.args.get("limit", VIEW_ALL_PAGE_SIZE))
+    except ValueError:
+        limit = VIEW_ALL_PAGE_SIZE
+    limit = max(1, min(limit, 1000))
+
+    people = iter_people_page(get_read_connection(), after_id, limit)
+    return Response(buffered(stream_template("view_all.html", people=people, after=after_id, limit=limit)))
+
+# ========================
+# Identity Cache
+# ========================
+# Read-through cache for /view and the single-identity API: uid -> (person, latest audits).
+# Writers call invalidate_identity() after committing. Each app has its own cache
+# in its process, so with several workers the TTL bounds how stale another
+# worker's copy can get.
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Holds at most `maxsize` entries and, when `sizeof` (value -> bytes) is
+    given, at most `maxbytes` bytes of values. Any object with the same
+    get/set/delete/clear/stats methods (e.g. a shared cache client) can
+    replace `identity_cache`.
+    """
+
+    def __init__(self, maxsize, ttl, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()   # key -> (expires at, value, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.maxsize <= 0 or (self.maxbytes is not None and size > self.maxbytes):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self._bytes += size
+            while len(self._entries) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'bytes': self._bytes,
+                'maxbytes': self.maxbytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+# one cache per app (built by create_app from IDENTITY_CACHE_SIZE/IDENTITY_CACHE_TTL)
+identity_cache = LocalProxy(lambda: current_app.extensions['identity_cache'])
+
+def get_identity(uid):
+    """(person, latest audits, has older audits) for uid through the cache, or None if it doesn't exist"""
+    cached = identity_cache.get(uid)
+    if cached is not None:
+        return cached
+    cached = load_identity(get_db().cursor(), uid)
+    if cached is not None:  # misses aren't cached so a newly created uid shows up at once
+        identity_cache.set(uid, cached)
+    return cached
+
+def load_identity(cur, uid):
+    """(person, latest audits, has older audits) straight from the database, or None"""
+    cur.execute("SELECT * FROM PeopleFull WHERE id=?", (uid,))
+    person = cur.fetchone()
+    if not person:
+        return None
+    return (person, *audit_history(cur, uid, AUDIT_LATEST_N))
+
+def invalidate_identity(*uids):
+    for uid in uids:
+        identity_cache.delete(uid)
+        for kind in FRAGMENT_KINDS:
+            fragment_cache.delete((kind, uid))
+
+@bp.route("/cache_stats")
+def cache_stats():
+    return jsonify(identity_cache.stats())
+
+# ========================
+# Fragment Cache
+# ========================
+# The per-identity parts of view_all (table row), search (result card) and
+# view (detail sections) are macros in templates/fragments/identity.html,
+# rendered once per row version: (kind, uid) -> (row_version, html). Every
+# write bumps row_version, so an entry rendered from an older version (another
+# worker's edit, the read snapshot) is simply re-rendered; invalidate_identity()
+# also drops them. A 1000-row view_all page is then mostly string joins.
+# Fragments run from about 0.6 KB (row) to 2 KB (detail), so the cache is
+# bounded by FRAGMENT_CACHE_MAX_BYTES of HTML per process as well as by count.
+FRAGMENT_KINDS = ('row', 'card', 'detail')
+
+fragment_cache = LocalProxy(lambda: current_app.extensions['fragment_cache'])
+
+def fragment_size(entry):
+    """Memory held by a (row_version, html) fragment cache entry's HTML"""
+    return sys.getsizeof(entry[1])
+
+@bp.app_template_global()
+def identity_fragment(kind, person):
+    """HTML of the `kind` macro in templates/fragments/identity.html for person, through the fragment cache"""
+    use_cache = current_app.config['FRAGMENT_CACHE']
+    key = (kind, person['id'])
+    if use_cache:
+        cached = fragment_cache.get(key)
+        if cached is not None and cached[0] == person['row_version']:
+            return cached[1]
+    # a macro call is much cheaper than a full Template.render
+    html = getattr(current_app.jinja_env.get_template("fragments/identity.html").module, kind)(person)
+    if use_cache:
+        fragment_cache.set(key, (person['row_version'], html))
+    return html
+
+# ========================
+# Response Compression
+# ========================
+# HTML, CSV and JSON bodies are compressed when the client accepts it: brotli
+# if the optional `brotli` package is installed, else gzip. Streamed bodies
+# (view_all, exports) are compressed chunk by chunk as they are generated.
+# File downloads (send_file) are passed through untouched.
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = {'text/html', 'text/csv', 'text/plain', 'application/json', 'application/x-ndjson'}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+def _compressor(encoding):
+    if encoding == 'br':
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31: gzip container
+
+def _iter_compressed(chunks, encoding):
+    # every chunk is flushed so the client gets it now (the body's chunks are
+    # already large, see buffered()); otherwise the compressor would hold the
+    # whole page until the end and streaming would gain nothing
+    compressor = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if encoding == 'br':
+                data = compressor.process(chunk) + compressor.flush()
+            else:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.finish() if encoding == 'br' else compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def compress_bytes(data, encoding):
+    compressor = _compressor(encoding)
+    if encoding == 'br':
+        return compressor.process(data) + compressor.finish()
+    return compressor.compress(data) + compressor.flush()
+
+@bp.after_app_request
+def compress_response(response):
+    if (not current_app.config['COMPRESS_RESPONSES'] or response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _iter_compressed(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:  # the bytes differ per encoding
+        response.set_etag(etag, weak=True)
+    return response
+
+# ========================
+# Audit History
+# ========================
+# Audit rows are written in the same transaction as the change they record.
+# Old rows are rolled over into AuditArchive (flask audit-rollover), so the
+# live table only holds recent history; pages read both through
+# idx_audit_person / idx_audit_archive_person, newest first.
+AUDIT_LATEST_N = 20
+AUDIT_HISTORY_PAGE_SIZE = 50
+AUDIT_ROLLOVER_BATCH_SIZE = 5000
+AUDIT_COLUMNS = "id, person_id, changed_at, field, old_value, new_value"
+
+def audit_history(cur, uid, limit, before=None):
+    """Up to `limit` audit rows for uid older than `before` (changed_at, id), newest first.
+
+    Returns (rows, has_more).
+    """
+    where = "person_id=?"
+    params = [uid]
+    if before:
+        where += " AND (changed_at < ? OR (changed_at = ? AND id < ?))"
+        params += [before[0], before[0], before[1]]
+    # each half stops after limit+1 rows from its index before the merge
+    page = (f"SELECT * FROM (SELECT {AUDIT_COLUMNS} FROM {{table}} WHERE {where} "
+            f"ORDER BY changed_at DESC, id DESC LIMIT ?)")
+    cur.execute(f"{page.format(table='Audit')} UNION ALL {page.format(table='AuditArchive')} "
+                f"ORDER BY changed_at DESC, id DESC LIMIT ?",
+                (*params, limit + 1, *params, limit + 1, limit + 1))
+    rows = cur.fetchall()
+    return rows[:limit], len(rows) > limit
+
+def record_deletion(cur, person, now):
+    """Audit row keeping a snapshot of an identity that is about to be deleted"""
+    cur.execute("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                (person['id'], now, 'deleted', json.dumps(dict(person)), None))
+
+def rollover_audit(older_than_days=None, batch_size=AUDIT_ROLLOVER_BATCH_SIZE):
+    """Move audit rows older than the cutoff (default: AUDIT_RETENTION_DAYS) into AuditArchive; returns how many moved"""
+    if older_than_days is None:
+        older_than_days = current_app.config['AUDIT_RETENTION_DAYS']
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+    moved = 0
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM People")
-    people = cur.fetchall()
-    conn.close()
-    return render_template("view_all.html", people=people)
+    try:
+        cur = conn.cursor()
+        while True:
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("SELECT id FROM Audit WHERE changed_at < ? ORDER BY changed_at LIMIT ?",
+                            (cutoff, batch_size))
+                ids = [row[0] for row in cur.fetchall()]
+                for chunk in _chunks(ids, SQL_IN_CHUNK):
+                    marks = ','.join('?' * len(chunk))
+                    cur.execute(f"INSERT INTO AuditArchive ({AUDIT_COLUMNS}) "
+                                f"SELECT {AUDIT_COLUMNS} FROM Audit WHERE id IN ({marks})", chunk)
+                    cur.execute(f"DELETE FROM Audit WHERE id IN ({marks})", chunk)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            moved += len(ids)
+            if len(ids) < batch_size:
+                break
+    finally:
+        conn.close()
+    if moved:
+        identity_cache.clear()
+    return moved
+
+@bp.route("/view/<uid>/history")
+def view_history(uid):
+    before = None
+    if request.args.get("before_at") and request.args.get("before_id", type=int) is not None:
+        before = (request.args["before_at"], request.args.get("before_id", type=int))
+    audits, has_more = audit_history(get_db().cursor(), uid, AUDIT_HISTORY_PAGE_SIZE, before)
+    return render_template("history.html", uid=uid, audits=audits, has_more=has_more)
+
+@bp.cli.command("audit-rollover")
+@click.option("--older-than-days", type=int, help="Default: AUDIT_RETENTION_DAYS.")
+@click.option("--batch-size", default=AUDIT_ROLLOVER_BATCH_SIZE, show_default=True, help="Rows per transaction.")
+def audit_rollover_command(older_than_days, batch_size):
+    """Move old audit rows from Audit into AuditArchive."""
+    started = time.perf_counter()
+    if older_than_days is None:
+        older_than_days = current_app.config['AUDIT_RETENTION_DAYS']
+    moved = rollover_audit(older_than_days, batch_size)
+    print(f"Archived {moved} audit rows older than {older_than_days} days in {time.perf_counter() - started:.2f}s")
 
 # ========================
 # View Single Identity
 # ========================
-@app.route("/view/<uid>")
+@bp.route("/view/<uid>")
 def view(uid):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM People WHERE id=?", (uid,))
-    person = cur.fetchone()
-    conn.close()
-    if not person:
+    identity = get_identity(uid)
+    if not identity:
         return "Identity not found"
-    # fetch audit history
-    conn2 = get_db_connection()
-    cur2 = conn2.cursor()
-    cur2.execute("SELECT * FROM Audit WHERE person_id=? ORDER BY changed_at DESC", (uid,))
-    audits = cur2.fetchall()
-    conn2.close()
-    return render_template("view.html", person=person, audits=audits)
+    person, audits, older_audits = identity
+    return render_template("view.html", person=person, audits=audits, older_audits=older_audits)
 
 # ========================
 # Delete identity
 # ========================
-@app.route("/delete/<uid>", methods=["POST"])
+@bp.route("/delete/<uid>", methods=["POST"])
 def delete(uid):
-    conn = get_db_connection()
+    conn = get_db()
     cur = conn.cursor()
-    cur.execute("DELETE FROM People WHERE id=?", (uid,))
+    cur.execute("BEGIN IMMEDIATE")
+    person = cur.execute("SELECT * FROM PeopleFull WHERE id=?", (uid,)).fetchone()
+    if person:
+        record_deletion(cur, person, datetime.now().isoformat())
+        cur.execute("DELETE FROM People WHERE id=?", (uid,))
     conn.commit()
-    conn.close()
+    invalidate_identity(uid)
     return redirect("/view_all")
 
 # ========================
 # Edit Identity
 # ========================
-@app.route("/edit/<uid>", methods=["GET","POST"])
+@bp.route("/edit/<uid>", methods=["GET","POST"])
 def edit(uid):
-    conn = get_db_connection()
+    conn = get_db()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM People WHERE id=?", (uid,))
+    cur.execute("SELECT * FROM PeopleFull WHERE id=?", (uid,))
     person = cur.fetchone()
     if not person:
-        conn.close()
         return "Identity not found"
 
     if request.method == "POST":
         # Check if trying to edit Archived status (not allowed)
         if person['status'] == 'Archived':
-            conn.close()
             return render_template("edit.html", person=person, error="Cannot edit archived identities")
         
         # collect editable fields based on sub_category
@@ -561,21 +2085,7 @@ def edit(uid):
         fields = ['first_name', 'last_name', 'status']
         
         # Add sub-category specific fields
-        if sub_cat in ['Undergraduate', 'Continuing Education', 'PhD Candidates', 'International/Exchange']:
-            fields.extend(['student_high_school_diploma_type', 'student_high_school_diploma_year', 'student_high_school_honors',
-                          'student_major', 'student_entry_year', 'student_faculty_department',
-                          'student_group', 'student_scholarship_status'])
-        elif sub_cat in ['Tenured', 'Adjunct/Part-time', 'Visiting Researchers']:
-            fields.extend(['faculty_rank', 'faculty_employment_category', 'faculty_appointment_start_date',
-                          'faculty_primary_department', 'faculty_secondary_departments',
-                          'faculty_office_building', 'faculty_office_floor', 'faculty_office_room',
-                          'faculty_phd_institution', 'faculty_research_areas', 'faculty_habilitation_supervise',
-                          'faculty_contract_type', 'faculty_contract_start_date', 'faculty_contract_end_date',
-                          'faculty_teaching_hours'])
-        elif sub_cat in ['Administrative', 'Technical', 'Temporary']:
-            fields.extend(['staff_assigned_department', 'staff_job_title', 'staff_grade', 'staff_entry_date'])
-        elif sub_cat in ['Contractors/Vendors', 'Alumni']:
-            fields.extend(['external_organization', 'external_contact_person'])
+        fields.extend(EDITABLE_FIELDS.get(GROUP_OF_SUB_CATEGORY.get(sub_cat), []))
         
         changes = []
         new_status = request.form.get('status')
@@ -584,7 +2094,6 @@ def edit(uid):
         # Validate status transition
         if new_status and new_status != old_status:
             if not is_valid_transition(old_status, new_status, person['status_changed_at']):
-                conn.close()
                 from_to = f"{old_status} → {new_status}"
                 if old_status == 'Inactive' and new_status == 'Archived':
                     years_ago = (datetime.now() - datetime.fromisoformat(person['status_changed_at'])).days / 365
@@ -594,85 +2103,916 @@ def edit(uid):
                     return render_template("edit.html", person=person, 
                                          error=f"Invalid status transition: {from_to} is not allowed")
         
+        # compute the whole diff first, then write it in one transaction
         for f in fields:
             new = request.form.get(f)
             old = person[f] if person[f] is not None else ''
             if str(new) != str(old):
                 changes.append((f, old, new))
-                if f == 'status':
-                    # Also update status_changed_at when status changes
-                    cur.execute(f"UPDATE People SET {f}=?, status_changed_at=? WHERE id=?", (new, datetime.now().isoformat(), uid))
-                else:
-                    cur.execute(f"UPDATE People SET {f}=? WHERE id=?", (new, uid))
+
         if changes:
             now = datetime.now().isoformat()
-            for f,old,new in changes:
-                cur.execute("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
-                            (uid, now, f, old, new))
-        conn.commit()
-        conn.close()
+            core_changes = [(f, new) for f, _, new in changes if COLUMN_TABLE[f] == 'People']
+            assignments = [f"{f}=?" for f, _ in core_changes]
+            params = [new for _, new in core_changes]
+            if any(f == 'status' for f, _, _ in changes):
+                # Also update status_changed_at when status changes
+                assignments.append("status_changed_at=?")
+                params.append(now)
+            # optimistic concurrency: only apply if the row is still the version the form was built from
+            expected_version = request.form.get('row_version', type=int) or person['row_version']
+            cur.execute("BEGIN IMMEDIATE")
+            # row_version lives on People, so profile-only edits still bump it here
+            cur.execute(f"UPDATE People SET {', '.join(assignments + ['row_version=row_version+1'])} "
+                        f"WHERE id=? AND row_version=?", (*params, uid, expected_version))
+            if cur.rowcount == 0:
+                conn.rollback()
+                cur.execute("SELECT * FROM PeopleFull WHERE id=?", (uid,))
+                current = cur.fetchone()
+                if not current:
+                    return "Identity not found"
+                return render_template("edit.html", person=current,
+                                     error="This identity was changed by someone else while you were editing. "
+                                           "The form now shows the current values; re-apply your changes and save again.")
+            profile_changes = {}
+            for f, _, new in changes:
+                if COLUMN_TABLE[f] != 'People':
+                    profile_changes.setdefault(COLUMN_TABLE[f], []).append((f, new))
+            for table, values in profile_changes.items():
+                cols = [f for f, _ in values]
+                cur.execute(f"INSERT INTO {table} (person_id, {', '.join(cols)}) "
+                            f"VALUES ({', '.join('?' * (len(cols) + 1))}) "
+                            f"ON CONFLICT(person_id) DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in cols)}",
+                            (uid, *(new for _, new in values)))
+            cur.executemany("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                            [(uid, now, f, old, new) for f, old, new in changes])
+            if any(f in ('first_name', 'last_name') for f, _ in core_changes):
+                cur.execute("DELETE FROM DedupKeys WHERE person_id=?", (uid,))
+                add_dedup_keys(cur, [{**dict(person), **dict(core_changes)}])
+            conn.commit()
+            invalidate_identity(uid)
         return redirect(f"/view/{uid}")
 
-    conn.close()
     return render_template("edit.html", person=person)
 
+# ========================
+# Lifecycle Engine
+# ========================
+# Automatic status transitions that depend only on how long an identity has
+# been in its current status. Rows with no status_changed_at are never moved.
+# (from status, to status, minimum days in from status): every transition with a
+# minimum wait in MIN_DAYS_IN_STATUS is applied automatically once it is due
+LIFECYCLE_RULES = [(from_status, to_status, min_days)
+                   for (from_status, to_status), min_days in MIN_DAYS_IN_STATUS.items()]
+LIFECYCLE_CHUNK_SIZE = 500
+
+def apply_status_change(cur, uids, from_status, to_status, now, changed_before=None):
+    """Move the given identities from from_status to to_status and audit each one.
+
+    Only rows still in from_status (and, if given, last changed before
+    changed_before) are updated, so a concurrent edit is never overwritten.
+    Runs inside the caller's transaction; returns the ids actually changed.
+    """
+    changed = []
+    for chunk in _chunks(list(uids), SQL_IN_CHUNK):
+        sql = (f"UPDATE People SET status=?, status_changed_at=?, row_version=row_version+1 "
+               f"WHERE id IN ({','.join('?' * len(chunk))}) AND status=?")
+        params = [to_status, now, *chunk, from_status]
+        if changed_before is not None:
+            sql += " AND status_changed_at < ?"
+            params.append(changed_before)
+        cur.execute(sql + " RETURNING id", params)
+        changed.extend(row[0] for row in cur.fetchall())
+    cur.executemany("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                    [(uid, now, 'status', from_status, to_status) for uid in changed])
+    return changed
+
+def run_lifecycle(dry_run=False, chunk_size=LIFECYCLE_CHUNK_SIZE, now=None):
+    """Apply every LIFECYCLE_RULES transition that is due; returns a report dict"""
+    started = time.perf_counter()
+    now = now or datetime.now()
+    report = {'dry_run': dry_run, 'rules': []}
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        for from_status, to_status, min_days in LIFECYCLE_RULES:
+            cutoff = (now - timedelta(days=min_days)).isoformat()
+            # served by idx_people_status (status, status_changed_at)
+            cur.execute("SELECT id FROM People WHERE status=? AND status_changed_at < ? ORDER BY status_changed_at",
+                        (from_status, cutoff))
+            eligible = [row[0] for row in cur.fetchall()]
+            changed = 0
+            if not dry_run:
+                for chunk in _chunks(eligible, chunk_size):
+                    cur.execute("BEGIN IMMEDIATE")
+                    try:
+                        done = apply_status_change(cur, chunk, from_status, to_status, now.isoformat(), cutoff)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    invalidate_identity(*done)
+                    changed += len(done)
+            report['rules'].append({'from': from_status, 'to': to_status, 'eligible': len(eligible),
+                                    'changed': changed})
+    finally:
+        conn.close()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+def format_lifecycle_report(report):
+    if report['dry_run']:
+        lines = [f"{rule['from']} -> {rule['to']}: {rule['eligible']} eligible (dry run, nothing changed)"
+                 for rule in report['rules']]
+    else:
+        lines = [f"{rule['from']} -> {rule['to']}: moved {rule['changed']} of {rule['eligible']} eligible"
+                 for rule in report['rules']]
+    lines.append(f"Finished in {report['seconds']}s")
+    return "\n".join(lines)
+
+class LifecycleScheduler:
+    """Runs run_lifecycle() from a daemon thread every LIFECYCLE_INTERVAL_SECONDS"""
+
+    def __init__(self, interval=None):
+        self.interval = interval   # None: the app's LIFECYCLE_INTERVAL_SECONDS
+        self._app = None
+        self._interval = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, app):
+        interval = app.config['LIFECYCLE_INTERVAL_SECONDS'] if self.interval is None else self.interval
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._app = app
+        self._interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="lifecycle-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        with self._app.app_context():
+            self._schedule_loop()
+
+    def _schedule_loop(self):
+        while not self._stop.is_set():
+            try:
+                report = run_lifecycle()
+                if any(rule['changed'] for rule in report['rules']):
+                    logger.info("Lifecycle run:\n%s", format_lifecycle_report(report))
+            except Exception:
+                logger.exception("Lifecycle run failed")
+            self._stop.wait(self._interval)
+
+lifecycle_scheduler = LifecycleScheduler()
+
+@bp.cli.command("lifecycle-run")
+@click.option("--dry-run", is_flag=True, help="Only report what would change.")
+@click.option("--chunk-size", default=LIFECYCLE_CHUNK_SIZE, show_default=True, help="Rows per transaction.")
+def lifecycle_run_command(dry_run, chunk_size):
+    """Apply due automatic status transitions (e.g. Inactive -> Archived after 5 years)."""
+    print(format_lifecycle_report(run_lifecycle(dry_run=dry_run, chunk_size=chunk_size)))
+
 # ========================
 # Search Identity
 # ========================
-@app.route("/search", methods=["GET","POST"])
+# Filters are typed and mapped onto the real People/profile columns. Facet
+# counts for every match come from one GROUP BY over the same FROM/WHERE as
+# the result page, which is fetched with LIMIT/OFFSET.
+SEARCH_PAGE_SIZE = 50
+SEARCH_DEPARTMENT = ("coalesce(student_profile.student_faculty_department, faculty_profile.faculty_primary_department, "
+                     "staff_profile.staff_assigned_department)")
+# filter -> (condition, number of placeholders); form fields are named <filter>_filter
+SEARCH_FILTERS = {
+    'type': ("People.type = ?", 1),
+    'sub_category': ("People.sub_category = ?", 1),
+    'status': ("People.status = ?", 1),
+    # entry year (or diploma year) of students, first year of faculty appointments and staff contracts
+    'year': ("People.id IN (SELECT person_id FROM student_profile WHERE student_entry_year = ? "
+             "UNION ALL SELECT person_id FROM student_profile WHERE student_high_school_diploma_year = ? "
+             "UNION ALL SELECT person_id FROM faculty_profile WHERE substr(faculty_appointment_start_date, 1, 4) = ? "
+             "UNION ALL SELECT person_id FROM staff_profile WHERE substr(staff_entry_date, 1, 4) = ?)", 4),
+    # word prefixes in the indexed department column (the coalesce would scan People)
+    'department': ("People.rowid IN (SELECT rowid FROM People_fts WHERE People_fts MATCH ?)", 1),
+}
+# facet -> (label, grouped expression)
+SEARCH_FACETS = {
+    'type': ("Type", "People.type"),
+    'status': ("Status", "People.status"),
+    'sub_category': ("Sub-category", "People.sub_category"),
+    'department': ("Department", SEARCH_DEPARTMENT),
+}
+SEARCH_FACET_VALUES_SHOWN = 10
+SEARCH_SORTS = {
+    'relevance': "People_fts.rank, People.id",
+    'name': "People.first_name, People.last_name, People.id",
+    'recent': "People.status_changed_at DESC, People.id",
+    'id': "People.id",
+}
+
+def parse_search_filters(values):
+    """Typed filters from the search form; returns (filters, errors)"""
+    filters, errors = {}, []
+    choices = {'type': SUB_CATEGORY_GROUPS, 'sub_category': ID_RANGES, 'status': VALID_TRANSITIONS}
+    for name in SEARCH_FILTERS:
+        value = (values.get(f"{name}_filter") or '').strip()
+        if not value:
+            continue
+        if name in choices and value not in choices[name]:
+            errors.append(f"Unknown {name.replace('_', '-')}: {value}")
+        elif name == 'year':
+            if not value.isdigit() or not 1900 <= int(value) <= 2100:
+                errors.append("Year must be between 1900 and 2100")
+            else:
+                filters[name] = value
+        elif name == 'department':
+            query = build_fts_query(value)
+            if not query:
+                errors.append("Department must contain letters or digits")
+            else:
+                filters[name] = f"department : ({query})"
+        else:
+            filters[name] = value
+    return filters, errors
+
+def search_from_where(match, filters):
+    """FROM/WHERE clause and parameters shared by the facet pass and the result page"""
+    if match:
+        sql = f"FROM People_fts JOIN People ON People.rowid = People_fts.rowid {PROFILE_JOINS} WHERE People_fts MATCH ?"
+        params = [match]
+    else:
+        sql = f"FROM People {PROFILE_JOINS} WHERE 1=1"
+        params = []
+    for name, value in filters.items():
+        condition, placeholders = SEARCH_FILTERS[name]
+        sql += f" AND {condition}"
+        params.extend([value] * placeholders)
+    return sql, params
+
+def search_facets_sql(from_where):
+    """Counts per combination of facet values, in one grouped pass"""
+    return (f"SELECT {', '.join(expr for _, expr in SEARCH_FACETS.values())}, COUNT(*) {from_where} "
+            f"GROUP BY {', '.join(str(i + 1) for i in range(len(SEARCH_FACETS)))}")
+
+def faceted_search(cur, match, filters, sort='name', offset=0, limit=SEARCH_PAGE_SIZE):
+    """One page of matches, facet counts over all matches and the total; returns (rows, facets, total)"""
+    from_where, params = search_from_where(match, filters)
+    cur.execute(search_facets_sql(from_where), params)
+    facets = {name: {} for name in SEARCH_FACETS}
+    total = 0
+    for row in cur.fetchall():
+        count = row[-1]
+        total += count
+        for name, value in zip(SEARCH_FACETS, row):
+            if value is not None:
+                facets[name][value] = facets[name].get(value, 0) + count
+    facets = {name: sorted(counts.items(), key=lambda item: (-item[1], item[0])) for name, counts in facets.items()}
+    if total <= offset:
+        return [], facets, total
+    if sort == 'relevance' and not match:
+        sort = 'name'
+    cur.execute(f"SELECT {PEOPLE_FULL_SELECT} {from_where} ORDER BY {SEARCH_SORTS[sort]} LIMIT ? OFFSET ?",
+                (*params, limit, offset))
+    return cur.fetchall(), facets, total
+
+@bp.route("/search", methods=["GET","POST"])
 def search():
-    results = []
-    if request.method == "POST":
-        query = request.form.get("query","").strip()
-        type_filter = request.form.get("type_filter","")
-        status_filter = request.form.get("status_filter","")
-        year_filter = request.form.get("year_filter","").strip()
-        department_filter = request.form.get("department_filter","").strip()
-        
-        conn = get_db_connection()
+    values = request.values
+    criteria = {k: values[k] for k in ['query', 'sort'] + [f"{name}_filter" for name in SEARCH_FILTERS]
+                if values.get(k, '').strip()}
+    if request.method == "GET" and not criteria:
+        return render_template("search.html", searched=False)
+
+    filters, errors = parse_search_filters(values)
+    match = build_fts_query(values.get("query", ""))
+    # text without a single word would match everything, not nothing
+    if values.get("query", "").strip() and not match:
+        errors.append("Search text must contain letters or digits")
+    if errors:
+        return render_template("search.html", searched=False, errors=errors), 400
+    sort = values.get("sort") if values.get("sort") in SEARCH_SORTS else ('relevance' if match else 'name')
+    page = max(values.get("page", 1, type=int), 1)
+
+    results, facets, total = faceted_search(get_read_db().cursor(), match, filters, sort,
+                                            (page - 1) * SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE)
+    link = lambda **changes: "/search?" + urlencode({k: v for k, v in {**criteria, **changes}.items() if v})
+    facet_links = [(label, [(value, count, link(**{f"{name}_filter": value, 'page': None}))
+                            for value, count in facets[name][:SEARCH_FACET_VALUES_SHOWN]])
+                   for name, (label, _) in SEARCH_FACETS.items() if facets[name]]
+    return render_template("search.html", searched=True, results=results, total=total, facets=facet_links,
+                           page=page, pages=(total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE,
+                           prev_url=link(page=page - 1) if page > 1 else None,
+                           next_url=link(page=page + 1) if page * SEARCH_PAGE_SIZE < total else None)
+
+# ========================
+# Bulk Status Changes
+# ========================
+# Moves a group of identities (a list of IDs or a /search filter) to one
+# status. Each chunk is validated against VALID_TRANSITIONS and
+# MIN_DAYS_IN_STATUS in a single query under the write lock, then changed
+# through apply_status_change() in the same transaction.
+BULK_STATUS_CHUNK_SIZE = 500
+# eligible: would change (dry run); not_allowed: not in VALID_TRANSITIONS; too_soon: MIN_DAYS_IN_STATUS not met
+BULK_STATUS_OUTCOMES = ['changed', 'eligible', 'unchanged', 'not_allowed', 'too_soon', 'not_found']
+
+def transition_outcome_sql(to_status, now):
+    """CASE expression giving each People row's outcome for a move to to_status, and its parameters"""
+    whens, params = ["WHEN status = ? THEN 'unchanged'"], [to_status]
+    for (from_status, target), min_days in MIN_DAYS_IN_STATUS.items():
+        if target == to_status:
+            # like is_valid_transition(), a missing status_changed_at does not block the move
+            whens.append("WHEN status = ? AND status_changed_at >= ? THEN 'too_soon'")
+            params += [from_status, (now - timedelta(days=min_days)).isoformat()]
+    allowed = [status for status, targets in VALID_TRANSITIONS.items() if to_status in targets]
+    if allowed:
+        whens.append(f"WHEN status IN ({','.join('?' * len(allowed))}) THEN 'eligible'")
+        params += allowed
+    return f"CASE {' '.join(whens)} ELSE 'not_allowed' END", params
+
+def parse_status_filter(spec):
+    """Search filters ({name: value}) selecting identities for a bulk change; returns (filters, errors)"""
+    unknown = [name for name in spec if name not in SEARCH_FILTERS]
+    if unknown:
+        return {}, [f"Unknown filter: {name}" for name in unknown]
+    filters, errors = parse_search_filters({f"{name}_filter": str(value) for name, value in spec.items()})
+    if not filters and not errors:
+        errors.append("The filter must narrow the selection")
+    return filters, errors
+
+def bulk_status_change(to_status, uids=None, filters=None, dry_run=False, chunk_size=BULK_STATUS_CHUNK_SIZE,
+                       now=None):
+    """Move the identities in `uids` (or matching `filters`) to to_status; returns a report with per-ID outcomes"""
+    started = time.perf_counter()
+    now = now or datetime.now()
+    outcome_sql, outcome_params = transition_outcome_sql(to_status, now)
+    outcomes = {}
+    conn = get_db_connection()
+    try:
         cur = conn.cursor()
-        sql = "SELECT * FROM People WHERE 1=1"
-        params = []
-        
-        # Search by name or email
-        if query:
-            sql += " AND (first_name LIKE ? OR last_name LIKE ? OR email LIKE ?)"
-            params.extend([f"%{query}%"]*3)
-        
-        # Filter by type
-        if type_filter:
-            sql += " AND type=?"
-            params.append(type_filter)
-        
-        # Filter by status
-        if status_filter:
-            sql += " AND status=?"
-            params.append(status_filter)
-        
-        # Filter by year
-        if year_filter:
-            sql += " AND (entry_year=? OR diploma_year=?)"
-            params.extend([year_filter]*2)
-        
-        # Filter by department
-        if department_filter:
-            sql += " AND (primary_department LIKE ? OR staff_department LIKE ?)"
-            params.extend([f"%{department_filter}%"]*2)
-        
-        sql += " ORDER BY first_name, last_name"
-        cur.execute(sql, tuple(params))
-        results = cur.fetchall()
+        if uids is None:
+            from_where, params = search_from_where(None, filters)
+            cur.execute(f"SELECT People.id {from_where} ORDER BY People.id", params)
+            uids = [row[0] for row in cur.fetchall()]
+        uids = list(dict.fromkeys(uids))
+        for chunk in _chunks(uids, chunk_size):
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                eligible = {}
+                for part in _chunks(chunk):
+                    cur.execute(f"SELECT id, status, {outcome_sql} FROM People "
+                                f"WHERE id IN ({','.join('?' * len(part))})", (*outcome_params, *part))
+                    for uid, status, outcome in cur.fetchall():
+                        outcomes[uid] = (outcome, status)
+                        if outcome == 'eligible':
+                            eligible.setdefault(status, []).append(uid)
+                changed = []
+                if not dry_run:
+                    for from_status, ids in eligible.items():
+                        changed += apply_status_change(cur, ids, from_status, to_status, now.isoformat())
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            invalidate_identity(*changed)
+            for uid in changed:
+                outcomes[uid] = ('changed', outcomes[uid][1])
+    finally:
         conn.close()
-    
-    return render_template("search.html", results=results)
+
+    results = [{'id': uid, 'outcome': outcomes.get(uid, ('not_found',))[0], 'from': outcomes.get(uid, (None, None))[1]}
+               for uid in uids]
+    counts = {outcome: 0 for outcome in BULK_STATUS_OUTCOMES}
+    for result in results:
+        counts[result['outcome']] += 1
+    return {'status': to_status, 'dry_run': dry_run, 'counts': counts, 'results': results,
+            'seconds': round(time.perf_counter() - started, 3)}
+
+@bp.route("/api/v1/identities/status", methods=["POST"])
+def api_bulk_status():
+    """Body: {"status": ..., "ids": [...]} or {"status": ..., "filter": {"type": ..., ...}}, optional "dry_run"."""
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return api_error("Expected a JSON object", 400)
+    if body.get('status') not in VALID_TRANSITIONS:
+        return api_error(f"'status' must be one of {', '.join(VALID_TRANSITIONS)}", 400)
+    uids, spec = body.get('ids'), body.get('filter')
+    if (uids is None) == (spec is None):
+        return api_error("Give exactly one of 'ids' and 'filter'", 400)
+    filters = None
+    if uids is not None and (not isinstance(uids, list) or not all(isinstance(uid, str) for uid in uids)):
+        return api_error("'ids' must be a list of identity IDs", 400)
+    if spec is not None:
+        if not isinstance(spec, dict):
+            return api_error("'filter' must be an object", 400)
+        filters, errors = parse_status_filter(spec)
+        if errors:
+            return api_error("; ".join(errors), 400)
+    dry_run = body.get('dry_run', False)
+    if not isinstance(dry_run, bool):
+        return api_error("'dry_run' must be true or false", 400)
+    return jsonify(bulk_status_change(body['status'], uids, filters, dry_run=dry_run))
+
+@bp.cli.command("bulk-status")
+@click.argument("status", type=click.Choice(list(VALID_TRANSITIONS)))
+@click.option("--id", "uids", multiple=True, help="Identity to move; repeatable.")
+@click.option("--ids-file", type=click.File(), help="File with one identity ID per line.")
+@click.option("--filter", "filter_items", multiple=True, metavar="NAME=VALUE",
+              help=f"Select by search filter ({', '.join(SEARCH_FILTERS)}); repeatable.")
+@click.option("--dry-run", is_flag=True, help="Only report what would change.")
+@click.option("--chunk-size", default=BULK_STATUS_CHUNK_SIZE, show_default=True, help="Identities per transaction.")
+@click.option("--verbose", "-v", is_flag=True, help="Print every identity's outcome, not only the failures.")
+def bulk_status_command(status, uids, ids_file, filter_items, dry_run, chunk_size, verbose):
+    """Move many identities to STATUS, validating every transition."""
+    uids = list(uids) + ([line.strip() for line in ids_file if line.strip()] if ids_file else [])
+    if bool(uids) == bool(filter_items):
+        raise click.UsageError("Give identities with --id/--ids-file or select them with --filter, not both")
+    filters = None
+    if filter_items:
+        spec = dict(item.partition("=")[::2] for item in filter_items)
+        filters, errors = parse_status_filter(spec)
+        if errors:
+            raise click.UsageError("; ".join(errors))
+    report = bulk_status_change(status, uids or None, filters, dry_run, chunk_size)
+    for result in report['results']:
+        if verbose or result['outcome'] not in ('changed', 'eligible', 'unchanged'):
+            print(f"{result['id']}  {result['outcome']}  (was {result['from'] or '-'})")
+    counts = ", ".join(f"{n} {outcome}" for outcome, n in report['counts'].items() if n)
+    print(f"{'Dry run: ' if dry_run else ''}{len(report['results'])} identities -> {status}: "
+          f"{counts or 'nothing to do'} in {report['seconds']}s")
+
+# ========================
+# Export
+# ========================
+# Rows are streamed straight from the cursor in fixed-size batches, so memory
+# stays flat whatever the table size. `since` exports only rows whose
+# watermark column is newer than the given ISO timestamp. The audit export
+# reads Audit and AuditArchive, so rolled-over rows stay in the full dumps;
+# SQLite merges the two already-ordered halves without a sort.
+EXPORT_BATCH_SIZE = 1000
+EXPORT_TABLES = {
+    'people': {'tables': ['PeopleFull'], 'watermark': 'status_changed_at', 'order': 'id'},
+    'audit': {'tables': ['Audit', 'AuditArchive'], 'watermark': 'changed_at', 'order': 'id'},
+}
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+def export_sql(name, since=None):
+    """(sql, params) reading every row of an export table, or only those newer than `since`"""
+    spec = EXPORT_TABLES[name]
+    if since:
+        # ordered by the watermark so a consumer can resume from the last value it saw
+        where, order = f" WHERE {spec['watermark']} > ?", f"{spec['watermark']}, {spec['order']}"
+    else:
+        where, order = "", spec['order']
+    sql = " UNION ALL ".join(f"SELECT * FROM {table}{where}" for table in spec['tables'])
+    return f"{sql} ORDER BY {order}", (since,) * len(spec['tables']) if since else ()
+
+def iter_export_batches(name, since=None, batch_size=EXPORT_BATCH_SIZE, conn=None):
+    """Yield (column names, list of row tuples) batches for an export table.
+
+    Reads from `conn` (default: a new primary connection) and closes it when done.
+    """
+    sql, params = export_sql(name, since)
+    conn = conn or get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield columns, [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+def iter_export_csv(batches):
+    header_written = False
+    for columns, rows in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+def iter_export_jsonl(batches):
+    for columns, rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+def _parquet_value(value, is_int):
+    if value is None or not is_int:
+        return None if value is None else str(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def write_export_parquet(name, target, since=None, conn=None):
+    """Write an export table to a Parquet file (path or binary file object), one row group per batch"""
+    # imported here: pyarrow is optional and slow to import, so workers only pay for it when used
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    conn = conn or get_db_connection()
+    declared = {row['name']: (row['type'] or '').upper()
+                for row in conn.execute(f"PRAGMA table_info({EXPORT_TABLES[name]['tables'][0]})")}
+    writer = None
+    try:
+        for columns, rows in iter_export_batches(name, since, conn=conn):
+            int_cols = [declared.get(c) == 'INTEGER' for c in columns]
+            if writer is None:
+                schema = pa.schema([(c, pa.int64() if is_int else pa.string()) for c, is_int in zip(columns, int_cols)])
+                writer = pq.ParquetWriter(target, schema)
+            data = {c: [_parquet_value(row[i], int_cols[i]) for row in rows] for i, c in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return writer is not None
+
+@bp.route("/export/<name>.<fmt>")
+def export(name, fmt):
+    if name not in EXPORT_TABLES or fmt not in EXPORT_MIMETYPES:
+        return render_template("error.html", error=f"Unknown export: {name}.{fmt}"), 404
+    since = request.args.get("since") or None
+    filename = f"{name}-{datetime.now():%Y%m%d%H%M%S}.{fmt}"
+    if fmt == 'parquet':
+        # Parquet needs its footer written last, so it is spooled to a temp file
+        spool = tempfile.TemporaryFile()
+        try:
+            if not write_export_parquet(name, spool, since, get_read_connection()):
+                spool.close()
+                return Response(status=204)
+        except RuntimeError as e:
+            spool.close()
+            return render_template("error.html", error=str(e)), 501
+        spool.seek(0)
+        return send_file(spool, mimetype=EXPORT_MIMETYPES[fmt], as_attachment=True, download_name=filename)
+
+    batches = iter_export_batches(name, since, conn=get_read_connection())
+    body = iter_export_csv(batches) if fmt == 'csv' else iter_export_jsonl(batches)
+    return Response(body, mimetype=EXPORT_MIMETYPES[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@bp.cli.command("export")
+@click.argument("name", type=click.Choice(sorted(EXPORT_TABLES)))
+@click.option("--format", "fmt", type=click.Choice(sorted(EXPORT_MIMETYPES)), default="csv", show_default=True)
+@click.option("--since", help="Only rows whose watermark (status_changed_at / changed_at) is newer than this ISO timestamp.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Output file (default: stdout; required for parquet).")
+def export_command(name, fmt, since, output):
+    """Dump People or the audit trail (Audit and AuditArchive) as CSV, JSONL or Parquet."""
+    if fmt == 'parquet':
+        if not output:
+            raise click.UsageError("--output is required for parquet")
+        write_export_parquet(name, output, since)
+        return
+    batches = iter_export_batches(name, since)
+    chunks = iter_export_csv(batches) if fmt == 'csv' else iter_export_jsonl(batches)
+    stream = open(output, "w", encoding="utf-8", newline="") if output else click.get_text_stream("stdout")
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+
+# ========================
+# JSON API
+# ========================
+# Read-only JSON resources for integrations. Every response carries an ETag
+# built from the row_version of the rows it contains; a client that sends it
+# back in If-None-Match gets an empty 304 while nothing has changed.
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_DEFAULT_FIELDS = ['id', 'type', 'sub_category', 'first_name', 'last_name', 'email', 'status', 'row_version']
+API_FIELDS = set(PEOPLE_COLUMNS) | {'row_version'}
+API_FILTERS = ('type', 'sub_category', 'status')
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+def parse_api_limit(value):
+    try:
+        limit = int(value if value is not None else API_PAGE_SIZE)
+    except ValueError:
+        limit = API_PAGE_SIZE
+    return max(1, min(limit, API_MAX_PAGE_SIZE))
+
+def parse_api_fields(requested):
+    """Requested fields "a,b,c" (always including id and row_version), or None if one is unknown"""
+    if not requested:
+        return API_DEFAULT_FIELDS
+    fields = [f.strip() for f in requested.split(",") if f.strip()]
+    if any(f not in API_FIELDS for f in fields):
+        return None
+    for required in ('row_version', 'id'):
+        if required not in fields:
+            fields.insert(0, required)
+    return fields
+
+def _api_limit():
+    return parse_api_limit(request.args.get("limit"))
+
+def _api_fields():
+    return parse_api_fields(request.args.get("fields"))
+
+def _api_filters():
+    return {column: request.args[column] for column in API_FILTERS if request.args.get(column)}
+
+def _api_select(fields):
+    """Qualified SELECT list and the profile-table joins those fields need"""
+    tables = {COLUMN_TABLE[f] for f in fields}
+    joins = " ".join(f"LEFT JOIN {table} ON {table}.person_id = People.id"
+                     for table, _ in PROFILE_TABLES.values() if table in tables)
+    return ", ".join(f"{COLUMN_TABLE[f]}.{f}" for f in fields), joins
+
+def query_identities(cur, fields, after_id, filters, limit):
+    """One keyset page of identities ordered by id"""
+    columns, joins = _api_select(fields)
+    sql = f"SELECT {columns} FROM People {joins} WHERE People.id > ?"
+    params = [after_id]
+    for column, value in filters.items():
+        sql += f" AND People.{column}=?"
+        params.append(value)
+    sql += " ORDER BY People.id LIMIT ?"
+    params.append(limit)
+    return cur.execute(sql, params).fetchall()
+
+def query_identity_search(cur, fields, match, filters, limit):
+    """Best-ranked identities for an FTS5 MATCH expression"""
+    columns, joins = _api_select(fields)
+    sql = (f"SELECT {columns} FROM People_fts "
+           f"JOIN People ON People.rowid = People_fts.rowid {joins} WHERE People_fts MATCH ?")
+    params = [match]
+    for column, value in filters.items():
+        sql += f" AND People.{column}=?"
+        params.append(value)
+    sql += " ORDER BY People_fts.rank LIMIT ?"
+    params.append(limit)
+    return cur.execute(sql, params).fetchall()
+
+def rows_etag(rows, *extra):
+    """ETag over the (id, row_version) of every row plus anything else shaping the body"""
+    digest = hashlib.sha1(repr(extra).encode())
+    for row in rows:
+        digest.update(f"{row['id']}:{row['row_version']};".encode())
+    return digest.hexdigest()
+
+def conditional_json(etag, build_payload):
+    """304 when the client already has this ETag, otherwise the JSON payload tagged with it"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build_payload())
+    # weak: the same payload may go out gzip'ed or not (see compress_response)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route("/api/v1/identities")
+def api_list_identities():
+    fields = _api_fields()
+    if fields is None:
+        return api_error("Unknown field in 'fields'", 400)
+    limit = _api_limit()
+    rows = query_identities(get_read_db().cursor(), fields, request.args.get("after", ""), _api_filters(), limit)
+    next_after = rows[-1]['id'] if len(rows) == limit else None
+    return conditional_json(rows_etag(rows, fields, next_after),
+                            lambda: {'items': [dict(row) for row in rows], 'next_after': next_after})
+
+@bp.route("/api/v1/identities/search")
+def api_search_identities():
+    fields = _api_fields()
+    if fields is None:
+        return api_error("Unknown field in 'fields'", 400)
+    match = build_fts_query(request.args.get("q", ""))
+    if not match:
+        return api_error("Parameter 'q' is required", 400)
+    rows = query_identity_search(get_read_db().cursor(), fields, match, _api_filters(), _api_limit())
+    return conditional_json(rows_etag(rows, fields),
+                            lambda: {'items': [dict(row) for row in rows]})
+
+@bp.route("/api/v1/identities/<uid>")
+def api_get_identity(uid):
+    identity = get_identity(uid)
+    if not identity:
+        return api_error("Identity not found", 404)
+    person = identity[0]
+    return conditional_json(rows_etag([person]), lambda: dict(person))
+
+# ========================
+# Query Plan Check
+# ========================
+# The lookups every request path depends on; none of them may scan a table.
+def search_plan(name, filters, sort='name', match=None, facets=False):
+    """HOT_QUERIES entry for the result page (or the facet pass) of a search"""
+    from_where, params = search_from_where(match, filters)
+    if facets:
+        return (name, search_facets_sql(from_where), params)
+    return (name, f"SELECT {PEOPLE_FULL_SELECT} {from_where} ORDER BY {SEARCH_SORTS[sort]} LIMIT 50", params)
+
+HOT_QUERIES = [
+    ("allocate ids", "SELECT next_value FROM IdSequence WHERE prefix=?", ("STU",)),
+    ("uniqueness check", UNIQUENESS_SQL, ("a", "b", "2000-01-01", "Undergraduate", "a@b.c")),
+    ("batch email check", "SELECT lower(email) FROM People WHERE email COLLATE NOCASE IN (?,?)", ("a@b.c", "d@e.f")),
+    ("batch identity check", identity_keys_sql(2),
+     ("a", "b", "2000-01-01", "Undergraduate", "c", "d", "2001-02-03", "Tenured")),
+    ("duplicate candidates",
+     f"SELECT DISTINCT {DEDUP_CANDIDATE_COLUMNS} FROM DedupKeys JOIN People ON People.id = DedupKeys.person_id "
+     f"WHERE block_key IN (?,?,?)", ("f:2000-01-01|A000", "l:2000-01-01|B000", "y:2000|A000|B000")),
+    ("dedup key refresh", "DELETE FROM DedupKeys WHERE person_id=?", ("STU202400001",)),
+    ("view", "SELECT * FROM PeopleFull WHERE id=?", ("STU202400001",)),
+    ("latest audits",
+     f"SELECT * FROM (SELECT {AUDIT_COLUMNS} FROM Audit WHERE person_id=? ORDER BY changed_at DESC, id DESC LIMIT ?) "
+     f"UNION ALL SELECT * FROM (SELECT {AUDIT_COLUMNS} FROM AuditArchive WHERE person_id=? "
+     f"ORDER BY changed_at DESC, id DESC LIMIT ?) ORDER BY changed_at DESC, id DESC LIMIT ?",
+     ("STU202400001", 21, "STU202400001", 21, 21)),
+    ("audit rollover selection", "SELECT id FROM Audit WHERE changed_at < ? ORDER BY changed_at LIMIT ?",
+     ("2024-01-01", 5000)),
+    search_plan("search text and type", {'type': "Student"}, 'relevance', '"a"*'),
+    search_plan("search by type", {'type': "Student"}),
+    search_plan("search by status", {'status': "Active"}, 'recent'),
+    search_plan("search by sub-category", {'sub_category': "Tenured"}),
+    search_plan("search by year", {'year': "2021"}),
+    search_plan("search by department", {'department': 'department : ("comp"*)'}),
+    search_plan("search facets", {'type': "Student", 'year': "2021"}, facets=True),
+    ("bulk status check",
+     f"SELECT id, status, {transition_outcome_sql('Archived', datetime.now())[0]} FROM People WHERE id IN (?,?)",
+     (*transition_outcome_sql('Archived', datetime.now())[1], "STU202400001", "STU202400002")),
+    ("lifecycle selection",
+     "SELECT id FROM People WHERE status=? AND status_changed_at < ? ORDER BY status_changed_at",
+     ("Inactive", "2020-01-01")),
+    ("outbox claim",
+     "SELECT id, recipient, subject, body, attempts FROM Outbox WHERE sent_at IS NULL AND next_attempt_at <= ? "
+     "ORDER BY next_attempt_at LIMIT ?", ("2024-01-01", 50)),
+    ("incremental people export", *export_sql('people', "2024-01-01")),
+    ("incremental audit export", *export_sql('audit', "2024-01-01")),
+]
+
+def find_full_scans(cur):
+    """Return (name, plan detail) for every hot query whose plan scans a real table"""
+    scans = []
+    for name, sql, params in HOT_QUERIES:
+        cur.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        subqueries = set()
+        for row in cur.fetchall():
+            detail = row[-1]
+            if detail.startswith(("CO-ROUTINE ", "MATERIALIZE ")):
+                subqueries.add(detail.split(" ", 1)[1])
+            # FTS lookups show up as "SCAN People_fts VIRTUAL TABLE INDEX ...",
+            # a SELECT without FROM or a VALUES list as "SCAN [N] CONSTANT ROW(S)",
+            # and reading back an already-limited subquery as "SCAN (subquery-N)"
+            # or as "SCAN <name>" after its CO-ROUTINE/MATERIALIZE step
+            if (detail.startswith("SCAN") and "VIRTUAL TABLE" not in detail
+                    and "CONSTANT ROW" not in detail and not detail.startswith("SCAN (subquery")
+                    and detail.split(" ", 2)[1] not in subqueries):
+                scans.append((name, detail))
+    return scans
+
+@bp.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail if any hot query does a full table scan."""
+    conn = get_db_connection()
+    scans = find_full_scans(conn.cursor())
+    conn.close()
+    for name, detail in scans:
+        print(f"FULL SCAN in {name}: {detail}")
+    if scans:
+        raise SystemExit(1)
+    print(f"All {len(HOT_QUERIES)} hot queries use an index")
+
+# ========================
+# Application Factory
+# ========================
+# create_app() builds the Flask app from a config class: it loads .env,
+# applies pending migrations once, precompiles every template, and registers
+# the routes and CLI commands. Importing app.py has no side effects: every
+# setting that comes from the environment is a Config attribute read when the
+# app is created. Everything that touches the database reads DATABASE and
+# READ_SNAPSHOT from the current app's config, so several apps (e.g. in tests)
+# can live in one process. Background workers are started by the entry points
+# (wsgi.py, `python app.py`), not by the factory, so CLI commands and tests
+# don't spawn threads.
+class EnvSetting:
+    """Config attribute taken from the environment variable of the same name, or `default`.
+
+    The variable is read when create_app() loads the config, after .env.
+    """
+
+    def __init__(self, default, cast=str):
+        self.default = default
+        self.cast = cast
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = os.getenv(self.name)
+        return self.default if value is None else self.cast(value)
+
+def env_flag(value):
+    return value == "1"
+
+class Config:
+    DATABASE = EnvSetting("database.db")
+    DEBUG = False
+    # see Instrumentation, Response Compression, Identity Cache and Fragment Cache
+    METRICS_ENABLED = EnvSetting(False, env_flag)
+    SLOW_QUERY_MS = EnvSetting(100.0, float)
+    SLOW_REQUEST_MS = EnvSetting(500.0, float)
+    N_PLUS_ONE_THRESHOLD = EnvSetting(10, int)   # same statement this often in one request
+    COMPRESS_RESPONSES = EnvSetting(True, env_flag)
+    IDENTITY_CACHE_SIZE = EnvSetting(2048, int)
+    IDENTITY_CACHE_TTL = EnvSetting(60.0, float)
+    FRAGMENT_CACHE_SIZE = EnvSetting(20000, int)
+    FRAGMENT_CACHE_MAX_BYTES = EnvSetting(16 * 1024 * 1024, int)
+    FRAGMENT_CACHE_TTL = EnvSetting(3600.0, float)
+    TEMPLATES_AUTO_RELOAD = False   # templates are compiled once and never re-stat'ed
+    PRECOMPILE_TEMPLATES = True
+    # compiled templates are kept across restarts (keyed by source checksum) in
+    # Jinja's per-user cache directory, which it creates 0700 and checks the owner of
+    TEMPLATE_BYTECODE_CACHE = True
+    # file path of the read snapshot for reporting routes; unset = every read goes to DATABASE
+    READ_SNAPSHOT = EnvSetting(None, lambda value: value or None)
+    READ_SNAPSHOT_INTERVAL = EnvSetting(60, int)
+    READ_SNAPSHOT_MAX_AGE = EnvSetting(300, int)
+    # per-identity HTML fragments are reused across requests (see identity_fragment)
+    FRAGMENT_CACHE = True
+    # see Send confirmation email
+    SMTP_HOST = EnvSetting("smtp.gmail.com")
+    SMTP_PORT = EnvSetting(465, int)
+    SMTP_SSL = EnvSetting(True, env_flag)
+    EMAIL_USER = EnvSetting(None)
+    EMAIL_PASS = EnvSetting(None)
+    # see Duplicate Detection, Audit History and Lifecycle Engine
+    DEDUP_MATCH_THRESHOLD = EnvSetting(0.85, float)
+    AUDIT_RETENTION_DAYS = EnvSetting(365, int)
+    LIFECYCLE_INTERVAL_SECONDS = EnvSetting(86400, int)
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    PRECOMPILE_TEMPLATES = False
+    TEMPLATE_BYTECODE_CACHE = False
+    FRAGMENT_CACHE = False   # so edits to templates/fragments/ show up at once
+
+class ProductionConfig(Config):
+    pass
+
+CONFIGS = {'development': DevelopmentConfig, 'production': ProductionConfig}
+
+def create_app(config=None):
+    """Application factory; `config` is a config class or a CONFIGS name (default: $APP_ENV or production)"""
+    load_dotenv()
+    if config is None:
+        config = os.getenv("APP_ENV", "production")
+    if isinstance(config, str):
+        config = CONFIGS[config]
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.extensions['identity_cache'] = TTLCache(app.config['IDENTITY_CACHE_SIZE'], app.config['IDENTITY_CACHE_TTL'])
+    app.extensions['fragment_cache'] = TTLCache(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'],
+                                                app.config['FRAGMENT_CACHE_MAX_BYTES'], fragment_size)
+    app.register_blueprint(bp)
+    app.teardown_appcontext(close_db)
+
+    with app.app_context():
+        init_db()
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+    if app.config['PRECOMPILE_TEMPLATES']:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+    return app
+
+def start_background_workers(app):
+    """Start the per-process worker threads; they run inside `app`'s context and use its database"""
+    outbox_worker.start(app)
+    lifecycle_scheduler.start(app)
+    snapshot_refresher.start(app)
 
 # ========================
 # Run Application
 # ========================
+# Development server only; see wsgi.py for running under gunicorn/waitress.
 if __name__ == "__main__":
-    init_db()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    app = create_app(DevelopmentConfig)
+    start_background_workers(app)
     print("Starting Flask server...")
-    app.run(debug=True, host="127.0.0.5", port=5000)
+    app.run(host="127.0.0.5", port=5000)
    
    
 
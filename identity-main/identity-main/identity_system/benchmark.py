@@ -0,0 +1,443 @@
+"""Benchmark and load-test harness for the identity system.
+
+    python benchmark.py generate --scale 10000 --database bench.db
+    python benchmark.py run --database bench.db --requests 300 --output results.json
+    python benchmark.py run --mode http --url http://127.0.0.5:5000 --concurrency 8
+    python benchmark.py compare baseline.json results.json --threshold 0.15
+
+`generate` fills a database through the regular import path with realistic
+identities for every ID_RANGES sub-category, then spreads statuses and edit
+history over them. `run` drives the routes in-process (Flask test client,
+against a throw-away copy of the database) or over HTTP against a running
+server, and writes p50/p95/p99 latency and throughput per scenario as JSON.
+`compare` fails when a scenario's p95 got slower than the baseline by more
+than the threshold.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import click
+
+FIRST_NAMES = ["Amina", "Youssef", "Lina", "Omar", "Sara", "Karim", "Nour", "Mehdi", "Ines", "Adam",
+               "Hana", "Rayan", "Maya", "Samir", "Leila", "Yanis", "Salma", "Nabil", "Rania", "Ilyes",
+               "Emma", "Lucas", "Chloe", "Hugo", "Jade", "Louis", "Zoe", "Noah", "Alice", "Ethan"]
+LAST_NAMES = ["Benali", "Haddad", "Mansouri", "Cherif", "Bouzid", "Amrani", "Khelifi", "Saidi", "Rahmani",
+              "Belkacem", "Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand",
+              "Leroy", "Moreau", "Garcia", "Lopez", "Muller", "Rossi", "Silva", "Novak", "Kowalski"]
+DEPARTMENTS = ["Computer Science", "Mathematics", "Physics", "Chemistry", "Biology", "Economics",
+               "Law", "Medicine", "Civil Engineering", "Electrical Engineering", "Literature", "History"]
+MAJORS = ["Software Engineering", "Data Science", "Applied Mathematics", "Finance", "Genetics",
+          "Public Law", "Robotics", "Linguistics", "Architecture", "Statistics"]
+ORGANIZATIONS = ["Acme Corp", "Globex", "Initech", "Umbrella Services", "Stark Industries", "Wayne Enterprises",
+                 "Alumni Association", "Tech Innovations Inc.", "Northwind Traders", "Contoso"]
+STATUS_WEIGHTS = [("Active", 70), ("Pending", 10), ("Suspended", 5), ("Inactive", 12), ("Archived", 3)]
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+
+def import_app():
+    import app
+    return app
+
+
+def benchmark_config(app, database):
+    class BenchmarkConfig(app.ProductionConfig):
+        DATABASE = database
+    return BenchmarkConfig
+
+
+def load_app(database):
+    """Import app.py and build a production-config app on `database`; returns (module, Flask app)"""
+    app = import_app()
+    # init_db() reports applied migrations; keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        flask_app = app.create_app(benchmark_config(app, database))
+    return app, flask_app
+
+
+# ========================
+# Synthetic data
+# ========================
+def synthetic_record(rng, app, sub_category, n):
+    group = app.GROUP_OF_SUB_CATEGORY[sub_category]
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    record = {
+        "type": group, "sub_category": sub_category,
+        "first_name": first, "last_name": f"{last}{n}",
+        "dob": (date(1960, 1, 1) + timedelta(days=rng.randrange(16000))).isoformat(),
+        "place_of_birth": rng.choice(["Algiers", "Oran", "Paris", "Lyon", "Tunis", "Madrid"]),
+        "nationality": rng.choice(["Algerian", "French", "Tunisian", "Spanish"]),
+        "gender": rng.choice(["Male", "Female"]),
+        "email": f"{first}.{last}.{n}@bench.example.org".lower(),
+        "phone": f"0{rng.randrange(500000000, 799999999)}",
+    }
+    if group == "Student":
+        record.update(student_major=rng.choice(MAJORS), student_entry_year=str(rng.randrange(2015, 2025)),
+                      student_faculty_department=rng.choice(DEPARTMENTS), student_group=f"G{rng.randrange(1, 20)}",
+                      student_high_school_diploma_year=str(rng.randrange(2010, 2024)))
+    elif group == "Faculty":
+        record.update(faculty_rank=rng.choice(["Professor", "Associate Professor", "Lecturer"]),
+                      faculty_primary_department=rng.choice(DEPARTMENTS),
+                      faculty_appointment_start_date=f"{rng.randrange(1995, 2024)}-09-01",
+                      faculty_research_areas=", ".join(rng.sample(MAJORS, 2)))
+    elif group == "Staff":
+        record.update(staff_assigned_department=rng.choice(DEPARTMENTS + ["HR", "IT Services", "Library"]),
+                      staff_job_title=rng.choice(["Clerk", "Technician", "Coordinator", "Manager"]),
+                      staff_entry_date=f"{rng.randrange(1995, 2024)}-01-15")
+    else:
+        record.update(external_organization=rng.choice(ORGANIZATIONS),
+                      external_contact_person=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+    return record
+
+
+def plan_counts(app, total):
+    """Split `total` over every sub-category in proportion to its ID range, capped at the range size"""
+    capacity = {sub: r["end"] - r["start"] + 1 for sub, r in app.ID_RANGES.items()}
+    all_ids = sum(capacity.values())
+    return {sub: min(cap, max(1, round(total * cap / all_ids))) for sub, cap in capacity.items()}, all_ids
+
+
+def generate(database, total, seed):
+    app, flask_app = load_app(database)
+    rng = random.Random(seed)
+    counts, capacity = plan_counts(app, total)
+    if total > capacity:
+        print(f"Note: ID_RANGES hold {capacity} IDs in total; every range will be filled instead of {total} rows")
+
+    def rows():
+        n = 0
+        for sub_category, count in counts.items():
+            for _ in range(count):
+                n += 1
+                yield n, synthetic_record(rng, app, sub_category, n), None
+
+    with flask_app.app_context():
+        report = app.import_identities(rows(), send_emails=False, batch_size=1000)
+    print(f"Imported {report['imported']} identities in {report['seconds']:.1f}s "
+          f"({report['failed']} failed)")
+
+    # spread statuses over several years and give a share of identities some edit history
+    conn = sqlite3.connect(database)
+    ids = [row[0] for row in conn.execute("SELECT id FROM People")]
+    statuses = [s for s, weight in STATUS_WEIGHTS for _ in range(weight)]
+    now = datetime.now()
+    updates, audits = [], []
+    for uid in ids:
+        status = rng.choice(statuses)
+        changed_at = (now - timedelta(days=rng.randrange(1, 3650))).isoformat()
+        updates.append((status, changed_at, uid))
+        for _ in range(rng.choice([0, 0, 1, 2, 5])):
+            audits.append((uid, (now - timedelta(days=rng.randrange(1, 3650))).isoformat(),
+                           "first_name", "Old", "New"))
+    with conn:
+        conn.executemany("UPDATE People SET status=?, status_changed_at=? WHERE id=?", updates)
+        conn.executemany("INSERT INTO Audit (person_id,changed_at,field,old_value,new_value) VALUES (?,?,?,?,?)",
+                         audits)
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"Database {database}: {len(ids)} identities, {len(audits)} audit rows")
+
+
+# ========================
+# Scenarios
+# ========================
+# Each scenario returns (method, path, form data) for one request.
+def scenarios(app, ids, rng, create_sub_category):
+    terms = [name[:3].lower() for name in FIRST_NAMES + LAST_NAMES]
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def create():
+        with lock:
+            n = next(counter)
+        record = synthetic_record(rng, app, create_sub_category, 900000000 + n)
+        return "POST", "/create", record
+
+    def edit():
+        uid = rng.choice(ids)
+        return "EDIT", uid, None
+
+    return {
+        "view": lambda: ("GET", f"/view/{rng.choice(ids)}", None),
+        "view_all": lambda: ("GET", f"/view_all?after={rng.choice(ids)}", None),
+        "view_all_large": lambda: ("GET", f"/view_all?after={rng.choice(ids)}&limit=1000", None),
+        "search": lambda: ("GET", f"/search?query={rng.choice(terms)}", None),
+        "search_faceted": lambda: ("GET", f"/search?type_filter={rng.choice(list(app.SUB_CATEGORY_GROUPS))}"
+                                          f"&year_filter={rng.randrange(2015, 2024)}"
+                                          f"&department_filter={rng.choice(DEPARTMENTS)}", None),
+        "api_list": lambda: ("GET", f"/api/v1/identities?after={rng.choice(ids)}&limit=100", None),
+        "api_get": lambda: ("GET", f"/api/v1/identities/{rng.choice(ids)}", None),
+        "api_search": lambda: ("GET", f"/api/v1/identities/search?q={rng.choice(terms)}&limit=20", None),
+        "create": create if create_sub_category else None,
+        "edit": edit,
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, errors, wall):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(values), "errors": errors,
+        "p50_ms": ms(percentile(values, 50)), "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)), "mean_ms": ms(statistics.fmean(values)) if values else None,
+        "throughput_rps": round(len(values) / wall, 1) if wall else None,
+    }
+
+
+def run_load(send, make_request, requests, concurrency):
+    """Issue `requests` requests from `concurrency` threads; returns a summary dict"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def worker(count):
+        nonlocal errors
+        for _ in range(count):
+            request = make_request()
+            started = time.perf_counter()
+            ok = send(*request)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+
+    share = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, share))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_load_async(send, make_request, requests, concurrency):
+    """Like run_load, with `concurrency` coroutines on one event loop"""
+    latencies, errors = [], 0
+
+    async def worker(count):
+        nonlocal errors
+        for _ in range(count):
+            request = make_request()
+            started = time.perf_counter()
+            ok = await send(*request)
+            latencies.append(time.perf_counter() - started)
+            errors += 0 if ok else 1
+
+    share = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in share))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def asgi_sender(asgi_app):
+    """Call the ASGI app in-process (GET only; the native routes are read-only)"""
+    async def send(method, path, data):
+        path, _, query = path.partition("?")
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode(), "headers": []}
+        status = {}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        await asgi_app(scope, receive, capture)
+        return status.get("code", 500) < 400
+    return send
+
+
+def client_sender(app, flask_app):
+    """Send requests through a per-thread Flask test client"""
+    local = threading.local()
+
+    def send(method, path, data):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        if method == "EDIT":
+            # load the form's current values, change one field, submit with the row version
+            with flask_app.app_context():
+                person = app.get_db().execute("SELECT * FROM PeopleFull WHERE id=?", (path,)).fetchone()
+            if person is None or person["status"] == "Archived":
+                return True
+            form = {k: ("" if v is None else v) for k, v in dict(person).items()}
+            form["first_name"] = random.choice(FIRST_NAMES)
+            response = client.post(f"/edit/{path}", data=form)
+        elif method == "POST":
+            response = client.post(path, data=data)
+        else:
+            response = client.get(path)
+        response.get_data()
+        return response.status_code < 400
+    return send
+
+
+def http_sender(base_url):
+    def send(method, path, data):
+        if method == "EDIT":
+            with urllib.request.urlopen(f"{base_url}/api/v1/identities/{path}") as response:
+                person = json.load(response)
+            if person["status"] == "Archived":
+                return True
+            form = {k: ("" if v is None else v) for k, v in person.items()}
+            form["first_name"] = random.choice(FIRST_NAMES)
+            method, path, data = "POST", f"/edit/{path}", form
+        body = urllib.parse.urlencode(data).encode() if method == "POST" else None
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base_url + path, data=body)) as response:
+                response.read()
+                return response.status < 400
+        except urllib.error.HTTPError:
+            return False
+        except urllib.error.URLError:
+            return False
+    return send
+
+
+def sample_ids_over_http(base_url, limit=2000):
+    ids, after = [], ""
+    while len(ids) < limit:
+        with urllib.request.urlopen(f"{base_url}/api/v1/identities?fields=id&limit=500&after={after}") as response:
+            page = json.load(response)
+        ids += [item["id"] for item in page["items"]]
+        after = page["next_after"]
+        if not after:
+            break
+    return ids
+
+
+# ========================
+# CLI
+# ========================
+@click.group()
+def cli():
+    """Identity system benchmarks."""
+
+
+@cli.command("generate")
+@click.option("--scale", default="10k", help="1k, 10k, 100k or a row count.")
+@click.option("--database", default="bench.db", show_default=True)
+@click.option("--seed", default=1, show_default=True)
+def generate_command(scale, database, seed):
+    """Create a database filled with synthetic identities."""
+    total = SCALES.get(scale) or int(scale)
+    if os.path.exists(database):
+        os.remove(database)
+    generate(database, total, seed)
+
+
+@cli.command("run")
+@click.option("--mode", type=click.Choice(["client", "asgi", "http"]), default="client", show_default=True,
+              help="client: Flask test client; asgi: service.py's ASGI app in-process; http: a running server.")
+@click.option("--database", default="bench.db", show_default=True,
+              help="Client/asgi mode; a temporary copy is used.")
+@click.option("--url", default="http://127.0.0.5:5000", show_default=True, help="HTTP mode base URL.")
+@click.option("--requests", "requests_per_scenario", default=300, show_default=True)
+@click.option("--concurrency", default=1, show_default=True)
+@click.option("--scenario", "only", multiple=True, help="Run only these scenarios (repeatable).")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--output", type=click.Path(), help="Write the JSON results here as well as to stdout.")
+def run_command(mode, database, url, requests_per_scenario, concurrency, only, seed, output):
+    """Measure latency percentiles and throughput per scenario."""
+    rng = random.Random(seed)
+    workdir = None
+    if mode in ("client", "asgi"):
+        workdir = tempfile.mkdtemp(prefix="identity-bench-")
+        copy = os.path.join(workdir, "bench.db")
+        shutil.copyfile(database, copy)
+        app, flask_app = load_app(copy)
+        conn = sqlite3.connect(copy)
+        ids = [row[0] for row in conn.execute("SELECT id FROM People")]
+        next_values = dict(conn.execute("SELECT prefix, next_value FROM IdSequence").fetchall())
+        remaining = {sub: r["end"] + 1 - next_values.get(r["prefix"], r["start"]) for sub, r in app.ID_RANGES.items()}
+        rows = len(ids)
+        conn.close()
+        send = client_sender(app, flask_app)
+        if mode == "asgi":
+            import service
+            asgi_app = service.create_asgi_app(benchmark_config(app, copy), start_workers=False)
+            send = asgi_sender(asgi_app)
+    else:
+        app = import_app()  # only for ID_RANGES and the sub-category groups used by synthetic_record
+        ids = sample_ids_over_http(url)
+        remaining = {sub: requests_per_scenario for sub in app.ID_RANGES}
+        rows = None
+        send = http_sender(url.rstrip("/"))
+
+    # creates go to the sub-category with the most free IDs
+    create_sub = max(remaining, key=remaining.get)
+    if remaining[create_sub] < requests_per_scenario:
+        create_sub = None
+    results = {}
+    for name, make_request in scenarios(app, ids, rng, create_sub).items():
+        if (only and name not in only) or make_request is None:
+            continue
+        if mode == "asgi":
+            if not name.startswith("api_"):
+                continue  # only the JSON API is served natively by the ASGI app
+            asyncio.run(send(*make_request()))  # warm-up
+            results[name] = asyncio.run(run_load_async(send, make_request, requests_per_scenario, concurrency))
+        else:
+            send(*make_request())  # warm-up
+            results[name] = run_load(send, make_request, requests_per_scenario, concurrency)
+        click.echo(f"{name:10} p50 {results[name]['p50_ms']:>8} ms  p95 {results[name]['p95_ms']:>8} ms  "
+                   f"p99 {results[name]['p99_ms']:>8} ms  {results[name]['throughput_rps']:>8} req/s", err=True)
+    report = {
+        "meta": {"mode": mode, "rows": rows, "requests_per_scenario": requests_per_scenario,
+                 "concurrency": concurrency, "seed": seed, "python": platform.python_version(),
+                 "sqlite": sqlite3.sqlite_version, "started_at": datetime.now().isoformat(timespec="seconds")},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    click.echo(text)
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@cli.command("compare")
+@click.argument("baseline", type=click.File())
+@click.argument("current", type=click.File())
+@click.option("--threshold", default=0.15, show_default=True, help="Allowed relative p95 slowdown.")
+def compare_command(baseline, current, threshold):
+    """Compare two result files; exits 1 on a p95 regression."""
+    base, cur = json.load(baseline), json.load(current)
+    for key in ("mode", "rows", "concurrency"):
+        if base["meta"].get(key) != cur["meta"].get(key):
+            click.echo(f"Note: {key} differs ({base['meta'].get(key)} vs {cur['meta'].get(key)})", err=True)
+    base, cur = base["results"], cur["results"]
+    regressions = 0
+    for name in sorted(set(base) & set(cur)):
+        before, after = base[name]["p95_ms"], cur[name]["p95_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        click.echo(f"{name:10} p95 {before:>8} -> {after:>8} ms ({change:+.1%}) {flag}")
+    raise SystemExit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    cli()
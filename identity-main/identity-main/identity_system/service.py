@@ -0,0 +1,268 @@
+"""Async identity service core and ASGI entry point.
+
+    uvicorn --factory service:create_asgi_app --workers 4 --port 8000
+
+IdentityService exposes the read paths and identity creation as coroutines.
+sqlite3 never runs on the event loop. Reads go to a small pool of threads
+that each keep one tuned connection open. Writes go to a single writer thread,
+so they queue in-process instead of waiting on SQLite's lock. Confirmation
+emails go through the outbox as before: the request only inserts the Outbox
+row, and the worker thread does the SMTP I/O.
+
+create_asgi_app() serves the JSON API (the high-volume, scanner-facing URLs)
+natively on top of IdentityService, including POST /api/v1/identities, which
+creates an identity through the same path as /create. Every other URL is handed to the regular
+Flask app through asgiref's WSGI adapter when asgiref is installed.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as core
+
+DB_READ_THREADS = 4
+
+
+class DbExecutor:
+    """Runs callables as fn(conn, *args) on reader threads or on the single writer thread"""
+
+    def __init__(self, flask_app, read_threads=DB_READ_THREADS):
+        self._app = flask_app
+        self._local = threading.local()
+        self._readers = ThreadPoolExecutor(read_threads, thread_name_prefix="db-read", initializer=self._open)
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-write", initializer=self._open)
+
+    def _open(self):
+        # each thread stays inside the app's context, so it uses that app's database
+        self._local.context = self._app.app_context()
+        self._local.context.push()
+        self._local.conn = core.get_db_connection()
+
+    def _call(self, fn, args):
+        return fn(self._local.conn, *args)
+
+    async def read(self, fn, *args):
+        return await asyncio.wrap_future(self._readers.submit(self._call, fn, args))
+
+    async def write(self, fn, *args):
+        return await asyncio.wrap_future(self._writer.submit(self._call, fn, args))
+
+    def shutdown(self):
+        # Connections belong to their threads and are closed as the threads exit
+        self._readers.shutdown()
+        self._writer.shutdown()
+
+
+class IdentityService:
+    """Async facade over the identity data access and notification logic in app.py"""
+
+    def __init__(self, flask_app, executor=None):
+        self.cache = flask_app.extensions['identity_cache']
+        self.db = executor or DbExecutor(flask_app)
+
+    async def get_identity(self, uid):
+        """(person, latest audits, has older audits) or None; cache hits never leave the event loop"""
+        cached = self.cache.get(uid)
+        if cached is not None:
+            return cached
+        cached = await self.db.read(lambda conn: core.load_identity(conn.cursor(), uid))
+        if cached is not None:
+            self.cache.set(uid, cached)
+        return cached
+
+    async def list_identities(self, fields, after_id="", filters=None, limit=core.API_PAGE_SIZE):
+        return await self.db.read(lambda conn: core.query_identities(conn.cursor(), fields, after_id,
+                                                                     filters or {}, limit))
+
+    async def search_identities(self, match, fields, filters=None, limit=core.API_PAGE_SIZE):
+        return await self.db.read(lambda conn: core.query_identity_search(conn.cursor(), fields, match,
+                                                                          filters or {}, limit))
+
+    async def stats(self):
+        return await self.db.read(lambda conn: core.identity_stats(conn.cursor()))
+
+    async def create_identity(self, record, send_email=True, confirm_not_duplicate=False):
+        """Create one identity as /create does; returns (uid, errors, near-duplicate candidates)"""
+        uid, errors, candidates = await self.db.write(self._create, record, send_email, confirm_not_duplicate)
+        if uid and send_email and record.get('email'):
+            core.outbox_worker.wake()
+        return uid, errors, candidates
+
+    @staticmethod
+    def _create(conn, record, send_email, confirm_not_duplicate):
+        record = core._clean_import_record(record)
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            errors = core.validate_batch([record], cur)[0]
+            candidates = []
+            if not errors and not confirm_not_duplicate:
+                candidates = core.find_duplicate_candidates(cur, record)
+            if errors or candidates:
+                conn.rollback()
+                return None, errors, candidates
+            uid, errors = core.create_identity(cur, record, send_email)
+            if errors:
+                conn.rollback()
+                return None, errors, []
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return uid, None, []
+
+    def close(self):
+        self.db.shutdown()
+
+
+# ========================
+# ASGI application
+# ========================
+def _etag_matches(headers, etag):
+    value = headers.get(b"if-none-match", b"").decode()
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in value.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def _respond(send, status, payload=None, etag=None):
+    headers = [(b"cache-control", b"no-cache")]
+    body = b""
+    if etag:
+        headers.append((b"etag", f'"{etag}"'.encode()))
+    if payload is not None:
+        body = json.dumps(payload, sort_keys=True, default=str).encode()
+        headers.append((b"content-type", b"application/json"))
+    headers.append((b"content-length", str(len(body)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def handle_create(service, receive, send):
+    """POST /api/v1/identities: a JSON object of identity fields, optional "confirm_not_duplicate"."""
+    try:
+        record = json.loads(await _read_body(receive) or b"null")
+    except ValueError:
+        record = None
+    if not isinstance(record, dict):
+        await _respond(send, 400, {'error': "Expected a JSON object"})
+        return
+    confirm = record.pop('confirm_not_duplicate', False)
+    if not isinstance(confirm, bool):
+        await _respond(send, 400, {'error': "'confirm_not_duplicate' must be true or false"})
+        return
+    uid, errors, candidates = await service.create_identity(record, confirm_not_duplicate=confirm)
+    if errors:
+        await _respond(send, 400, {'error': "; ".join(errors), 'errors': errors})
+    elif candidates:
+        # same warning as the /create form: resend with "confirm_not_duplicate": true to create anyway
+        await _respond(send, 409, {'error': "Possible duplicate of an existing identity",
+                                   'candidates': [dict(row, score=score) for score, row in candidates]})
+    else:
+        await _respond(send, 201, {'id': uid})
+
+
+async def _respond_rows(send, headers, rows, payload, *extra):
+    etag = core.rows_etag(rows, *extra)
+    if _etag_matches(headers, etag):
+        await _respond(send, 304, etag=etag)
+    else:
+        await _respond(send, 200, payload, etag)
+
+
+async def handle_api(service, path, scope, send):
+    """Serve a JSON API request; returns False when the path isn't one of ours"""
+    args = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+    headers = dict(scope.get("headers", []))
+    if path == "/api/v1/stats":
+        await _respond(send, 200, await service.stats())
+        return True
+    if not path.startswith("/api/v1/identities"):
+        return False
+
+    fields = core.parse_api_fields(args.get("fields"))
+    filters = {c: args[c] for c in core.API_FILTERS if args.get(c)}
+    limit = core.parse_api_limit(args.get("limit"))
+    if path == "/api/v1/identities":
+        if fields is None:
+            await _respond(send, 400, {'error': "Unknown field in 'fields'"})
+            return True
+        rows = await service.list_identities(fields, args.get("after", ""), filters, limit)
+        next_after = rows[-1]['id'] if len(rows) == limit else None
+        await _respond_rows(send, headers, rows, {'items': [dict(r) for r in rows], 'next_after': next_after},
+                            fields, next_after)
+    elif path == "/api/v1/identities/search":
+        if fields is None:
+            await _respond(send, 400, {'error': "Unknown field in 'fields'"})
+            return True
+        match = core.build_fts_query(args.get("q", ""))
+        if not match:
+            await _respond(send, 400, {'error': "Parameter 'q' is required"})
+            return True
+        rows = await service.search_identities(match, fields, filters, limit)
+        await _respond_rows(send, headers, rows, {'items': [dict(r) for r in rows]}, fields)
+    else:
+        uid = path[len("/api/v1/identities/"):]
+        if not uid or "/" in uid:
+            return False
+        identity = await service.get_identity(uid)
+        if identity is None:
+            await _respond(send, 404, {'error': "Identity not found"})
+        else:
+            await _respond_rows(send, headers, [identity[0]], dict(identity[0]))
+    return True
+
+
+def create_asgi_app(config=None, start_workers=True):
+    """ASGI app: the JSON API served by IdentityService, everything else by the Flask app"""
+    flask_app = core.create_app(config)
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+        fallback = WsgiToAsgi(flask_app)
+    except ImportError:  # asgiref is optional; without it only the API is served
+        fallback = None
+    state = {}
+
+    def get_service():
+        if 'service' not in state:
+            state['service'] = IdentityService(flask_app)
+        return state['service']
+
+    async def asgi_app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    get_service()
+                    if start_workers:
+                        core.start_background_workers(flask_app)
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    if 'service' in state:
+                        state.pop('service').close()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "GET" and await handle_api(get_service(), scope["path"], scope, send):
+            return
+        if scope["method"] == "POST" and scope["path"] == "/api/v1/identities":
+            await handle_create(get_service(), receive, send)
+            return
+        if fallback is not None:
+            await fallback(scope, receive, send)
+        else:
+            await _respond(send, 404, {'error': "Only /api/v1 is served here; install asgiref for the full app"})
+
+    asgi_app.flask_app = flask_app
+    return asgi_app
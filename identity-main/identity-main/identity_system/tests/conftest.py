@@ -0,0 +1,42 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Config, create_app, create_identity, get_db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A fresh app on its own empty database, migrated by create_app()"""
+    class TestConfig(Config):
+        DATABASE = str(tmp_path / "identity.db")
+        READ_SNAPSHOT = None
+        TEMPLATE_BYTECODE_CACHE = False
+        PRECOMPILE_TEMPLATES = False
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def create_person(app):
+    """create_person(**fields) inserts a Pending Contractors/Vendors identity and returns its ID"""
+    serial = itertools.count(1)
+
+    def create(**fields):
+        n = next(serial)
+        record = dict({'type': "External", 'sub_category': "Contractors/Vendors", 'first_name': f"Person{n}",
+                       'last_name': "Test", 'dob': "1990-01-01", 'email': f"person{n}@example.org",
+                       'external_organization': "Acme"}, **fields)
+        with app.app_context():
+            conn = get_db()
+            conn.execute("BEGIN IMMEDIATE")
+            uid, errors = create_identity(conn.cursor(), record, send_email=False)
+            assert errors is None, errors
+            conn.commit()
+        return uid
+
+    return create
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import get_db
+
+
+def set_status(app, uid, status, days_ago=0):
+    with app.app_context():
+        conn = get_db()
+        conn.execute("UPDATE People SET status=?, status_changed_at=? WHERE id=?",
+                     (status, (datetime.now() - timedelta(days=days_ago)).isoformat(), uid))
+        conn.commit()
+
+
+def statuses(app, *uids):
+    with app.app_context():
+        cur = get_db().execute(f"SELECT id, status FROM People WHERE id IN ({','.join('?' * len(uids))})", uids)
+        return dict(cur.fetchall())
+
+
+def bulk_status(app, **body):
+    response = app.test_client().post("/api/v1/identities/status", json=body)
+    return response.status_code, response.get_json()
+
+
+def outcomes(report):
+    return {result['id']: result['outcome'] for result in report['results']}
+
+
+def test_outcome_per_identity(app, create_person):
+    pending, active, inactive = create_person(), create_person(), create_person()
+    set_status(app, active, 'Active')
+    set_status(app, inactive, 'Inactive')
+
+    status, report = bulk_status(app, status='Active', ids=[pending, active, inactive, "CON209999999"])
+
+    assert status == 200
+    assert outcomes(report) == {pending: 'changed', active: 'unchanged', inactive: 'not_allowed',
+                                "CON209999999": 'not_found'}
+    assert report['counts']['changed'] == 1
+    assert statuses(app, pending, active, inactive) == {pending: 'Active', active: 'Active', inactive: 'Inactive'}
+
+
+def test_minimum_days_in_status(app, create_person):
+    recent, due = create_person(), create_person()
+    set_status(app, recent, 'Inactive', days_ago=30)
+    set_status(app, due, 'Inactive', days_ago=6 * 365)
+
+    status, report = bulk_status(app, status='Archived', ids=[recent, due])
+
+    assert status == 200
+    assert outcomes(report) == {recent: 'too_soon', due: 'changed'}
+    assert statuses(app, recent, due) == {recent: 'Inactive', due: 'Archived'}
+
+
+def test_dry_run_changes_nothing(app, create_person):
+    pending, active = create_person(), create_person()
+    set_status(app, active, 'Active')
+
+    status, report = bulk_status(app, status='Active', ids=[pending, active], dry_run=True)
+
+    assert status == 200
+    assert report['dry_run'] is True
+    assert outcomes(report) == {pending: 'eligible', active: 'unchanged'}
+    assert statuses(app, pending, active) == {pending: 'Pending', active: 'Active'}
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM Audit").fetchone()[0] == 0
+
+
+def test_filter_selects_identities(app, create_person):
+    pending, active = create_person(), create_person()
+    set_status(app, active, 'Active')
+
+    status, report = bulk_status(app, status='Active', filter={'status': 'Pending'})
+
+    assert status == 200
+    assert outcomes(report) == {pending: 'changed'}
+
+
+@pytest.mark.parametrize("dry_run", ["false", "true", 0, 1, None])
+def test_dry_run_must_be_a_boolean(app, create_person, dry_run):
+    pending = create_person()
+
+    status, report = bulk_status(app, status='Active', ids=[pending], dry_run=dry_run)
+
+    assert status == 400
+    assert report == {'error': "'dry_run' must be true or false"}
+    assert statuses(app, pending) == {pending: 'Pending'}
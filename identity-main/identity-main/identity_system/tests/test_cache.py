@@ -0,0 +1,32 @@
+from app import TTLCache
+
+
+def test_bounded_by_bytes():
+    cache = TTLCache(maxsize=100, ttl=60, maxbytes=10, sizeof=len)
+    cache.set('a', "xxxx")
+    cache.set('b', "xxxx")
+    cache.get('a')
+    cache.set('c', "xxxx")   # 12 bytes: the least recently used entry goes
+
+    assert cache.get('b') is None
+    assert cache.get('a') == cache.get('c') == "xxxx"
+    assert cache.stats()['bytes'] == 8
+
+
+def test_replacing_and_deleting_release_bytes():
+    cache = TTLCache(maxsize=100, ttl=60, maxbytes=10, sizeof=len)
+    cache.set('a', "xxxxxxxx")
+    cache.set('a', "xx")
+    cache.set('b', "xxxxxxxx")
+    assert cache.stats()['bytes'] == 10
+    cache.delete('b')
+    assert cache.stats()['bytes'] == 2
+
+
+def test_value_larger_than_the_cache_is_not_kept():
+    cache = TTLCache(maxsize=100, ttl=60, maxbytes=10, sizeof=len)
+    cache.set('a', "xx")
+    cache.set('big', "x" * 11)
+
+    assert cache.get('big') is None
+    assert cache.get('a') == "xx"
@@ -0,0 +1,44 @@
+import re
+
+from app import get_db
+
+
+def load_edit_form(app, client, uid):
+    """The fields the edit page posts back, as it was rendered for `uid`"""
+    body = client.get(f"/edit/{uid}").get_data(as_text=True)
+    with app.app_context():
+        person = get_db().execute("SELECT * FROM PeopleFull WHERE id=?", (uid,)).fetchone()
+    form = {field: person[field] or '' for field in ('first_name', 'last_name', 'status',
+                                                     'external_organization', 'external_contact_person')}
+    form['row_version'] = re.search(r'name="row_version" value="(\d+)"', body).group(1)
+    return form
+
+
+def test_stale_edit_is_rejected(app, create_person):
+    uid = create_person(first_name="Original", last_name="Name")
+    client = app.test_client()
+    stale = load_edit_form(app, client, uid)
+
+    # someone else saves the same form first, which moves row_version on
+    assert client.post(f"/edit/{uid}", data=dict(stale, first_name="Fresh")).status_code == 302
+    response = client.post(f"/edit/{uid}", data=dict(stale, last_name="Stale"))
+
+    assert response.status_code == 200
+    assert "changed by someone else" in response.get_data(as_text=True)
+    with app.app_context():
+        cur = get_db().cursor()
+        person = cur.execute("SELECT first_name, last_name, row_version FROM People WHERE id=?", (uid,)).fetchone()
+        assert tuple(person) == ("Fresh", "Name", int(stale['row_version']) + 1)
+        cur.execute("SELECT field FROM Audit WHERE person_id=?", (uid,))
+        assert [row[0] for row in cur.fetchall()] == ['first_name']
+
+
+def test_current_edit_is_applied(app, create_person):
+    uid = create_person(last_name="Name")
+    client = app.test_client()
+    form = load_edit_form(app, client, uid)
+
+    assert client.post(f"/edit/{uid}", data=dict(form, last_name="Renamed")).status_code == 302
+    with app.app_context():
+        person = get_db().execute("SELECT last_name, row_version FROM People WHERE id=?", (uid,)).fetchone()
+        assert tuple(person) == ("Renamed", int(form['row_version']) + 1)
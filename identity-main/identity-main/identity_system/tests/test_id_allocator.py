@@ -0,0 +1,63 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from app import ID_RANGES, get_db
+
+THREADS = 16
+BUSY_RETRIES = 5
+RECORDS = {
+    'Undergraduate': {'type': 'Student', 'student_major': 'Physics', 'student_entry_year': '2024',
+                      'student_faculty_department': 'Science'},
+    'Contractors/Vendors': {'type': 'External', 'external_organization': 'Acme'},
+}
+
+
+def create_in_parallel(app, sub_category, count):
+    """POST `count` distinct identities to /create from THREADS threads; returns each new ID or the error shown"""
+    prefix = ID_RANGES[sub_category]['prefix']
+
+    def post(form):
+        body = app.test_client().post("/create", data=form).get_data(as_text=True)
+        found = re.search(rf'href="/view/({prefix}\d{{9}})"', body)
+        if found:
+            return found.group(1)
+        shown = re.findall(r'<div>([^<]+)</div>|<p>([^<]+)</p>', body)
+        return "; ".join(text for pair in shown for text in pair if text.strip()) or body
+
+    def create(i):
+        form = dict(RECORDS[sub_category], sub_category=sub_category, first_name=f"Parallel{i}",
+                    last_name=prefix, dob="2000-01-02", email=f"{prefix.lower()}{i}@example.org",
+                    phone="0600000000", confirm_not_duplicate="1")
+        # on a loaded machine a create can outwait the busy timeout; the form is simply sent again
+        for _ in range(BUSY_RETRIES):
+            result = post(form)
+            if result != "database is locked":
+                break
+        return result
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(create, range(count)))
+
+
+def test_parallel_creates_get_distinct_ids(app):
+    results = create_in_parallel(app, 'Undergraduate', 2000)
+
+    assert [result for result in results if not result.startswith("STU")] == []
+    assert len(set(results)) == 2000
+    with app.app_context():
+        cur = get_db().cursor()
+        cur.execute("SELECT COUNT(*) FROM People WHERE sub_category = 'Undergraduate'")
+        assert cur.fetchone()[0] == 2000
+        cur.execute("SELECT next_value FROM IdSequence WHERE prefix = 'STU'")
+        assert cur.fetchone()[0] == ID_RANGES['Undergraduate']['start'] + 2000
+
+
+def test_exhausted_range_fails_explicitly(app):
+    size = ID_RANGES['Contractors/Vendors']['end'] - ID_RANGES['Contractors/Vendors']['start'] + 1
+    results = create_in_parallel(app, 'Contractors/Vendors', size + 100)
+
+    ids = [result for result in results if result.startswith("CON")]
+    assert len(ids) == len(set(ids)) == size
+    failures = [result for result in results if not result.startswith("CON")]
+    assert len(failures) == 100
+    assert all("is exhausted" in failure for failure in failures)
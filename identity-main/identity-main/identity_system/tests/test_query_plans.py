@@ -0,0 +1,7 @@
+from app import HOT_QUERIES, find_full_scans, get_db
+
+
+def test_hot_queries_use_an_index(app):
+    with app.app_context():
+        assert HOT_QUERIES
+        assert find_full_scans(get_db().cursor()) == []
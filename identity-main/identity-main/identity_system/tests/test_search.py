@@ -0,0 +1,7 @@
+def test_query_without_words_is_rejected(app):
+    response = app.test_client().get("/search?query=@@@")
+
+    assert response.status_code == 400
+    body = response.get_data(as_text=True)
+    assert "Search text must contain letters or digits" in body
+    assert "Found " not in body
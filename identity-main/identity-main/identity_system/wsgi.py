@@ -0,0 +1,20 @@
+"""Production entry point.
+
+    gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8000 wsgi:app
+    waitress-serve --threads 8 --listen 0.0.0.0:8000 wsgi:app
+
+Set APP_ENV=development to get the debug config instead. Don't use
+gunicorn's --preload: each worker must start its own outbox and lifecycle
+threads. Starting several workers at once is safe because init_db() takes
+the write lock before applying a migration. The outbox worker leases
+messages and the lifecycle engine re-checks every row it moves, so running
+one of each per worker does no duplicate work.
+"""
+import logging
+
+from app import create_app, start_background_workers
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+app = create_app()
+start_background_workers(app)